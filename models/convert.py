@@ -1,20 +1,34 @@
-
 """Energy demand and supply adaptors
 """
+import numpy as np
 from smif.convert import RegionAdaptor, IntervalAdaptor, UnitAdaptor
 
 
-class ConvertGWMW(UnitAdaptor):
+class KeepFloat32(object):
+    """Keep float32 inputs as float32 through a conversion
+
+    Conversion coefficients are float64, so without this a float32 input, such as
+    energy demand results in float32 precision mode, comes out as float64.
+    """
+    def convert(self, data_array, *args, **kwargs):
+        result = super().convert(data_array, *args, **kwargs)
+        data = getattr(data_array, 'data', data_array)
+        if getattr(data, 'dtype', None) == np.float32:
+            result = np.asarray(result).astype(np.float32)
+        return result
+
+
+class ConvertGWMW(KeepFloat32, UnitAdaptor):
     """Convert GW to MW for energy demand-supply
     """
 
 
-class ConvertLADtoEnergyHub(RegionAdaptor):
+class ConvertLADtoEnergyHub(KeepFloat32, RegionAdaptor):
     """Convert LAD to Energy Hub for energy demand-supply
     """
 
 
-class ConvertHourlyToSeasonalWeek(IntervalAdaptor):
+class ConvertHourlyToSeasonalWeek(KeepFloat32, IntervalAdaptor):
     """Convert Hourly to Seasonal Week for energy demand-supply
     """
 
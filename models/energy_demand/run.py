@@ -1,25 +1,348 @@
 """The sector model wrapper for smif to run the energy demand model
 """
+import copy
+import hashlib
 import os
 import logging
-from collections import defaultdict
+import multiprocessing
+import pickle
+import tempfile
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from configparser import ConfigParser
+
+import numpy as np
 from shapely.geometry import shape, mapping
 
 from smif.model.sector_model import SectorModel
 
+import energy_demand
 from energy_demand import wrapper_model
 from energy_demand.assumptions import strategy_vars_def, general_assumptions
 from energy_demand.main import energy_demand_model
 from energy_demand.basic import basic_functions
-from energy_demand.read_write import (write_data, read_data, data_loader,
+from energy_demand.read_write import (read_data, data_loader,
                                       narrative_related)
 
+# Results of before_model_run, read by simulate in each timestep
+PRE_SIMULATION_FILENAME = "pre_simulation.pickle"
+
+# Model inputs inherited by worker processes when simulating regions in parallel
+_SHARED_MODEL_INPUTS = None
+
+# All narrative parameters
+NARRATIVE_PARAMETERS = [
+    'air_leakage',
+    'assump_diff_floorarea_pp',
+    'cooled_floorarea',
+    'dm_improvement',
+    'f_eff_achieved',
+    'generic_enduse_change',
+    'heat_recovered',
+    'p_cold_rolling_steel',
+    'rs_t_base_heating',
+    'ss_t_base_heating',
+    'is_t_base_heating',
+    'smart_meter_p',
+    'generic_fuel_switch']
+
+# Narrative parameters read in this process, by content hash, least recently used first.
+# Shared by model runs, so runs which vary some narratives reuse the others.
+_NARRATIVE_REGISTRY = OrderedDict()
+
+# Number of narrative parameter values to keep in the registry
+NARRATIVE_REGISTRY_SIZE = 128
+
+
+class RegionArray(Mapping):
+    """A read-only dict-like view of an array indexed by region on its first axis
+
+    Looking up a region returns the matching slice of the array without copying,
+    so code written for ``{region: value}`` dicts can read region-indexed arrays.
+
+    Arguments
+    ---------
+    array : numpy.ndarray
+    regions : list
+        Region names, in the order of the first axis of `array`
+    index : dict, default=None
+        Position of each region, if already built for the same regions
+    """
+    def __init__(self, array, regions, index=None):
+        self.array = array
+        self.regions = regions
+        if index is None:
+            index = {region: i for i, region in enumerate(regions)}
+        self.index = index
+
+    def __getitem__(self, region):
+        return self.array[self.index[region]]
+
+    def __iter__(self):
+        return iter(self.regions)
+
+    def __len__(self):
+        return len(self.regions)
+
+
+class RegionRecords(RegionArray):
+    """A read-only dict-like view of several region-indexed arrays
+
+    Looking up a region returns a dict of the matching slice of each array.
+
+    Arguments
+    ---------
+    arrays : dict
+        Maps field name to a numpy.ndarray indexed by region on its first axis
+    regions : list
+    index : dict, default=None
+    """
+    def __getitem__(self, region):
+        i = self.index[region]
+        return {name: values[i] for name, values in self.array.items()}
+
+
+class NarrativeParameters(Mapping):
+    """Narrative parameters of a model run, read when looked up and shared by content
+
+    Each parameter is read through ``narrative_related.read_user_defined_param``
+    when it is first looked up. Results are kept in `registry`, keyed by a hash of
+    the parameter values held by smif, the simulation years and the default, so
+    model runs in a process which share a narrative parameter value read it once.
+
+    Arguments
+    ---------
+    data_handle : smif.data_layer.DataHandle
+    simulation_base_yr : int
+    simulation_end_yr : int
+    default_streategy_vars : dict
+        Default strategy variables, by parameter name
+    digests : dict, default=None
+        Hashes of the parameter values, by name, as from ``parameter_digests``
+    registry : collections.OrderedDict, default=None
+        Parameters already read, by content hash, or the registry of the process
+    size : int, default=NARRATIVE_REGISTRY_SIZE
+        Number of parameters to keep in `registry`, dropping the least recently used
+    """
+    def __init__(self, data_handle, simulation_base_yr, simulation_end_yr,
+                 default_streategy_vars, digests=None, registry=None,
+                 size=NARRATIVE_REGISTRY_SIZE):
+        self.data_handle = data_handle
+        self.simulation_base_yr = simulation_base_yr
+        self.simulation_end_yr = simulation_end_yr
+        self.default_streategy_vars = default_streategy_vars
+        self.digests = {} if digests is None else digests
+        self.registry = _NARRATIVE_REGISTRY if registry is None else registry
+        self.size = size
+
+    def __getitem__(self, var_name):
+        if var_name not in NARRATIVE_PARAMETERS:
+            raise KeyError(var_name)
+
+        if var_name not in self.digests:
+            self.digests.update(parameter_digests(self.data_handle, [var_name]))
+
+        digest = hashlib.sha256()
+        digest.update(self.digests[var_name].encode('utf-8'))
+        digest.update(pickle.dumps((
+            self.simulation_base_yr,
+            self.simulation_end_yr,
+            self.default_streategy_vars[var_name])))
+        key = digest.hexdigest()
+
+        if key in self.registry:
+            self.registry.move_to_end(key)
+        else:
+            logging.debug("... reading in scenaric values for parameter: '{}'".format(var_name))
+            param_raw_series = self.data_handle.get_parameter(var_name).as_df()
+            df_raw = EDWrapper._series_to_df(param_raw_series, var_name)
+            self.registry[key] = narrative_related.read_user_defined_param(
+                df_raw,
+                simulation_base_yr=self.simulation_base_yr,
+                simulation_end_yr=self.simulation_end_yr,
+                default_streategy_var=self.default_streategy_vars[var_name],
+                var_name=var_name)
+            while len(self.registry) > self.size:
+                self.registry.popitem(last=False)
+
+        # Hand out copies, as strategy variables are updated in place
+        return copy.deepcopy(self.registry[key])
+
+    def __iter__(self):
+        return iter(NARRATIVE_PARAMETERS)
+
+    def __len__(self):
+        return len(NARRATIVE_PARAMETERS)
+
+
+class TemperatureProvider(object):
+    """Loads minimum and maximum temperatures once for each weather year
+
+    Temperatures for a weather year are held in one read-only array of shape
+    ``(2, regions, ...)``, with ``t_min`` then ``t_max``. Once the arrays held in
+    memory would take more than `memmap_bytes`, further arrays are written to a
+    temporary file and memory-mapped, so the operating system can share and page
+    them.
+
+    Arguments
+    ---------
+    memmap_bytes : int, default=None
+        Total size of the arrays held in memory, above which arrays are
+        memory-mapped, or None to always keep them in memory
+    """
+    def __init__(self, memmap_bytes=None):
+        self.memmap_bytes = memmap_bytes
+        self._arrays = {}
+        self._directory = None
+        self._resident_bytes = 0
+
+    @property
+    def weather_yrs(self):
+        """Weather years currently loaded
+        """
+        return list(self._arrays)
+
+    def load(self, data_handle, weather_yr):
+        """Return the ``(t_min, t_max)`` arrays for a weather year
+
+        Arguments
+        ---------
+        data_handle : smif.data_layer.DataHandle
+        weather_yr : int
+
+        Returns
+        -------
+        numpy.ndarray
+            Read-only array of shape ``(2, regions, ...)``
+        """
+        if weather_yr not in self._arrays:
+            logging.debug("... load temperatures for weather year %s", weather_yr)
+            array = np.stack((
+                data_handle.get_data('t_min', weather_yr).as_ndarray(),
+                data_handle.get_data('t_max', weather_yr).as_ndarray()))
+
+            if self.memmap_bytes is not None and \
+                    self._resident_bytes + array.nbytes > self.memmap_bytes:
+                if self._directory is None:
+                    self._directory = tempfile.TemporaryDirectory(prefix='ed_temperatures_')
+                filename = os.path.join(
+                    self._directory.name, 'temperatures_{}.npy'.format(weather_yr))
+                np.save(filename, array)
+                array = np.load(filename, mmap_mode='r')
+            else:
+                array.setflags(write=False)
+                self._resident_bytes += array.nbytes
+            self._arrays[weather_yr] = array
+        return self._arrays[weather_yr]
+
+    def retain(self, weather_yrs):
+        """Forget the arrays of every weather year not in `weather_yrs`
+        """
+        for weather_yr in self.weather_yrs:
+            if weather_yr in weather_yrs:
+                continue
+            array = self._arrays.pop(weather_yr)
+            if isinstance(array, np.memmap):
+                filename = array.filename
+                del array
+                try:
+                    os.remove(filename)
+                except OSError:
+                    # Still mapped where it cannot be removed, so left for the
+                    # temporary directory to clean up
+                    pass
+            else:
+                self._resident_bytes -= array.nbytes
+
+
 class EDWrapper(SectorModel):
     """Energy Demand Wrapper
     """
+    _config_filename = 'run_config.ini'
+
     def __init__(self, name):
+        self._set_options()
         super().__init__(name)
         self.user_data = {}
+        # (content hash, pickled bytes) of the before_model_run results
+        self._pre_simulation = None
+        # Values which do not change between timesteps, by name: (key, value)
+        self._run_cache = {}
+        # Position of each region, shared by RegionArray views: (regions, index)
+        self._region_index = None
+        self._temperatures = TemperatureProvider(self._temperature_memmap_bytes)
+        # Whether simulating in parallel has been checked against one process
+        self._processes_checked = False
+
+    def _set_options(self):
+        config = ConfigParser()
+        config.read(os.path.join(os.path.dirname(__file__), self._config_filename))
+        if 'run' not in config:
+            config['run'] = {}
+
+        self._array_native = config['run'].getboolean('array_native', fallback=False)
+
+        # Weather year used for every simulation year, unless each year has its own
+        self._weather_yr = config['run'].getint('weather_yr', fallback=2015)
+        self._per_year_weather = config['run'].getboolean('per_year_weather', fallback=False)
+        self._temperature_memmap_bytes = int(
+            config['run'].getfloat('temperature_memmap_mb', fallback=512) * 1024 ** 2)
+
+        # Also write results to text files, alongside the results passed to smif
+        self._write_text_results = config['run'].getboolean(
+            'write_text_results', fallback=True)
+
+        # Precision of hourly results passed to smif, checked to a relative tolerance
+        self._output_precision = np.dtype(
+            config['run'].get('output_precision', fallback='float64'))
+        if self._output_precision not in (np.float32, np.float64):
+            raise ValueError(
+                "Expected output_precision float32 or float64, got {}".format(
+                    self._output_precision))
+        self._float32_rtol = config['run'].getfloat('float32_rtol', fallback=1e-6)
+
+        # Skip before_model_run if its results exist for the same inputs
+        self._resume = config['run'].getboolean('resume', fallback=False)
+
+        # Worker processes to simulate regions in, or 0 for one per CPU
+        self._processes = config['run'].getint('processes', fallback=1) or os.cpu_count()
+        if self._processes > 1 and self._write_text_results:
+            raise ValueError(
+                "write_text_results needs the whole model in one process, so cannot be "
+                "used with processes = {}".format(self._processes))
+        # Also simulate the first timestep in one process, to check the model gives
+        # the same results for chunks of regions
+        self._check_processes = config['run'].getboolean('check_processes', fallback=True)
+
+    def _cached(self, data_handle, name, key, compute):
+        """Compute a value once per model run and key, and return a copy of it
+
+        Only the latest key is kept for each name, so a change in the inputs the key
+        is made from replaces the cached value.
+
+        Arguments
+        ---------
+        data_handle : smif.data_layer.DataHandle
+        name : str
+            Name of the cached value
+        key : hashable
+            Everything the value depends on, apart from the model run
+        compute : function
+            Called with no arguments to compute the value
+        """
+        key = (data_handle._modelrun_name, key)
+        if name not in self._run_cache or self._run_cache[name][0] != key:
+            self._run_cache[name] = (key, compute())
+        # Hand out copies, as the model may change its inputs while it runs
+        return copy.deepcopy(self._run_cache[name][1])
+
+    def _read_config(self, data_handle):
+        """Read wrapperconfig.ini, once per model run unless the file changes
+        """
+        config_file_path = os.path.join(self._get_working_dir(), 'wrapperconfig.ini')
+        return self._cached(
+            data_handle, 'config', (config_file_path, os.path.getmtime(config_file_path)),
+            lambda: data_loader.read_config_file(config_file_path))
 
     def _assign_array_to_dict(self, array_in, regions):
         """Convert array to dict with same order as region list
@@ -34,13 +357,25 @@ class EDWrapper(SectorModel):
         Returns
         -------
         dict_out : dict
-            Dictionary of array_in
+            Dictionary of array_in, or a RegionArray view of it if running
+            array native
         """
+        if self._array_native:
+            return RegionArray(array_in, regions, self._get_region_index(regions))
+
         dict_out = {}
         for r_idx, region in enumerate(regions):
             dict_out[region] = array_in[r_idx]
         return dict_out
 
+    def _get_region_index(self, regions):
+        """Position of each region, built once for each list of regions
+        """
+        if self._region_index is None or self._region_index[0] != regions:
+            self._region_index = (
+                regions, {region: i for i, region in enumerate(regions)})
+        return self._region_index[1]
+
     def _get_mode(self, data_handle):
         """Get constrained or unconstrained mode
         """
@@ -143,52 +478,86 @@ class EDWrapper(SectorModel):
         coordinates = basic_functions.get_long_lat_decimal_degrees(centroids)
         return coordinates
 
+    def _get_region_coordinates(self, data_handle, regions):
+        """Region centroid coordinates, computed once per model run
+        """
+        return self._cached(
+            data_handle, 'reg_coord', tuple(regions.ids),
+            lambda: self._get_coordinates(regions))
+
+    def _load_base_yr_scenario_data(self, data_handle, base_yr, regions):
+        """Load base year population, gva and floor area by region
+        """
+        scenario_data = defaultdict(dict)
+        scenario_data['gva_industry'] = defaultdict(dict)
+        scenario_data['rs_floorarea'] = defaultdict(dict)
+        scenario_data['ss_floorarea'] = defaultdict(dict)
+
+        pop_array_by = data_handle.get_base_timestep_data('population').as_ndarray()
+        gva_array_by = data_handle.get_base_timestep_data('gva_per_head').as_ndarray()
+
+        scenario_data['population'][base_yr] = self._assign_array_to_dict(pop_array_by, regions)
+        scenario_data['gva_per_head'][base_yr] = self._assign_array_to_dict(gva_array_by, regions)
+        scenario_data['gva_industry'][base_yr] = self._load_gva_sector_data(data_handle, regions)
+
+        floor_area_base = data_handle.get_base_timestep_data('floor_area').as_ndarray()
+        scenario_data['rs_floorarea'][base_yr] = self._assign_array_to_dict(floor_area_base[:, 0], regions)
+        scenario_data['ss_floorarea'][base_yr] = self._assign_array_to_dict(floor_area_base[:, 1], regions)
+        return scenario_data
+
     def _calculate_pop_density(self, pop_array_by, region_set_name):
-        pop_density = {}
-        for region_nr, region in enumerate(pop_array_by.spec.dim_coords(region_set_name).elements):
-            area_region = shape(region['feature']['geometry']).area
-            population = pop_array_by.as_ndarray()[region_nr]
-            pop_density[region['name']] = population / area_region
+        elements = pop_array_by.spec.dim_coords(region_set_name).elements
+        areas = np.array([shape(region['feature']['geometry']).area for region in elements])
+        pop_density = pop_array_by.as_ndarray() / areas
 
-        return pop_density
+        return self._assign_array_to_dict(pop_density, [region['name'] for region in elements])
 
     def _get_temperatures(self, data_handle, sim_yrs, regions, constant_weather=False):
         """Load minimum and maximum temperatures
+
+        Each weather year is loaded once per model run. Simulation years which share a
+        weather year share the same read-only temperature arrays.
         """
         logging.debug("... load temperature")
-        temp_data = defaultdict(dict)
+        temp_data = {}
+        by_weather_yr = {}
 
         for simulation_yr in sim_yrs:
-
-            if constant_weather:
-                simulation_yr = sim_yrs[0]
+            if self._per_year_weather and not constant_weather:
+                weather_yr = simulation_yr
             else:
-                pass
-
-            t_min = data_handle.get_data('t_min', 2015).as_ndarray()
-            t_max = data_handle.get_data('t_max', 2015).as_ndarray()
-
-            for region_nr, region_name in enumerate(regions):
-                temp_data[simulation_yr][region_name] = {
-                    't_min': t_min[region_nr],
-                    't_max': t_max[region_nr]}
-
-        return dict(temp_data)
-
-    def _load_gva_sector_data(self, data_handle, regions):
-        """Load sector specific gva data
+                weather_yr = self._weather_yr
+
+            if weather_yr not in by_weather_yr:
+                t_min, t_max = self._temperatures.load(data_handle, weather_yr)
+                if self._array_native:
+                    by_weather_yr[weather_yr] = RegionRecords(
+                        {'t_min': t_min, 't_max': t_max}, regions, self._get_region_index(regions))
+                else:
+                    by_weather_yr[weather_yr] = {
+                        region_name: {'t_min': t_min[region_nr], 't_max': t_max[region_nr]}
+                        for region_nr, region_name in enumerate(regions)
+                    }
+            temp_data[simulation_yr] = by_weather_yr[weather_yr]
+
+        return temp_data
+
+    def _load_gva_sector_data(self, data_handle, regions, gva_sector_data=None):
+        """Load sector specific gva data, unless already read as `gva_sector_data`
         """
         out_dict = {}
 
-        gva_sector_data = data_handle.get_base_timestep_data('gva_per_sector')
+        if gva_sector_data is None:
+            gva_sector_data = data_handle.get_base_timestep_data('gva_per_sector')
         sectors_to_load = gva_sector_data.spec.dim_coords('sectors').ids
         sectors_to_load_str = gva_sector_data.spec.dim_coords('sectors').ids
         sectors_to_load = []
         for i in sectors_to_load_str:
             sectors_to_load.append(int(i))
 
+        gva_sector_array = gva_sector_data.as_ndarray()
         for gva_sector_nr, sector_id in enumerate(sectors_to_load):
-            out_dict[sector_id] = self._assign_array_to_dict(gva_sector_data.as_ndarray()[:, gva_sector_nr], regions)
+            out_dict[sector_id] = self._assign_array_to_dict(gva_sector_array[:, gva_sector_nr], regions)
 
         return out_dict
 
@@ -197,41 +566,56 @@ class EDWrapper(SectorModel):
             data_handle,
             simulation_base_yr,
             simulation_end_yr,
-            default_streategy_vars
+            default_streategy_vars,
+            digests=None
         ):
+        """Narrative parameters, each read when first looked up
+
+        Returns
+        -------
+        NarrativeParameters
+            A dict-like mapping of parameter name to the values read by
+            ``narrative_related.read_user_defined_param``
         """
+        return NarrativeParameters(
+            data_handle, simulation_base_yr, simulation_end_yr, default_streategy_vars,
+            digests)
+
+    def _get_strategy_vars(self, data_handle, config):
+        """Build strategy variables from defaults and narrative parameters
+
+        Cached for the model run, and rebuilt if any narrative parameter value changes.
         """
-        narrative_params = {}
-
-        # All narrative parameters
-        variable_names = [
-            'air_leakage',
-            'assump_diff_floorarea_pp',
-            'cooled_floorarea',
-            'dm_improvement',
-            'f_eff_achieved',
-            'generic_enduse_change',
-            'heat_recovered',
-            'p_cold_rolling_steel',
-            'rs_t_base_heating',
-            'ss_t_base_heating',
-            'is_t_base_heating',
-            'smart_meter_p',
-            'generic_fuel_switch']
-
-        for var_name in variable_names:
-            logging.debug("... reading in scenaric values for parameter: '{}'".format(var_name))
-            param_raw_series = data_handle.get_parameter(var_name).as_df()
-            df_raw = self._series_to_df(param_raw_series, var_name)
+        base_yr = config['CONFIG']['base_yr']
+        end_yr = config['CONFIG']['user_defined_simulation_end_yr']
+        digests = parameter_digests(data_handle, NARRATIVE_PARAMETERS)
 
-            narrative_params[var_name] = narrative_related.read_user_defined_param(
-                df_raw,
-                simulation_base_yr=simulation_base_yr,
-                simulation_end_yr=simulation_end_yr,
-                default_streategy_var=default_streategy_vars[var_name],
-                var_name=var_name)
+        def compute():
+            # Load hard-coded standard default assumptions
+            default_streategy_vars = strategy_vars_def.load_param_assump(
+                hard_coded_default_val=True)
+
+            strategy_vars = strategy_vars_def.generate_default_parameter_narratives(
+                default_streategy_vars=default_streategy_vars,
+                end_yr=end_yr,
+                base_yr=base_yr)
 
-        return narrative_params
+            user_defined_vars = self._load_narrative_parameters(
+                data_handle,
+                simulation_base_yr=base_yr,
+                simulation_end_yr=end_yr,
+                default_streategy_vars=default_streategy_vars,
+                digests=digests)
+
+            strategy_vars = data_loader.replace_variable(user_defined_vars, strategy_vars)
+
+            # Replace strategy variables not defined in csv files)
+            return strategy_vars_def.autocomplete_strategy_vars(
+                strategy_vars,
+                narrative_crit=True)
+
+        key = (base_yr, end_yr, tuple(digests[name] for name in NARRATIVE_PARAMETERS))
+        return self._cached(data_handle, 'strategy_vars', key, compute)
 
     def before_model_run(self, data_handle):
         """Implement this method to conduct pre-model run tasks
@@ -244,9 +628,9 @@ class EDWrapper(SectorModel):
                    the hardcoded base year"
             raise ValueError(msg)
 
-        path_main = self._get_working_dir()
-        config_file_path = os.path.join(path_main, 'wrapperconfig.ini')
-        config = data_loader.read_config_file(config_file_path)
+        self._run_cache = {}
+        self._temperatures = TemperatureProvider(self._temperature_memmap_bytes)
+        config = self._read_config(data_handle)
 
         # Replace constrained | unconstrained mode from narrative
         mode = self._get_mode(data_handle)
@@ -262,31 +646,25 @@ class EDWrapper(SectorModel):
         sim_yrs = self._get_simulation_yrs(data_handle)
 
         temp_path = config['PATHS']['path_result_data']
-        self.create_folders_rename_folders(config)
+        pre_simulation_filename = os.path.join(temp_path, PRE_SIMULATION_FILENAME)
+        base_data = {
+            name: data_handle.get_base_timestep_data(name)
+            for name in ['population', 'gva_per_head', 'floor_area', 'gva_per_sector']
+        }
+        inputs_hash = None
+        if self._resume:
+            inputs_hash = self._pre_simulation_inputs_hash(data_handle, base_data)
+            if pre_simulation_is_current(pre_simulation_filename, inputs_hash):
+                logging.info("... reusing results from a previous before_model_run() in " + temp_path)
+                self._pre_simulation = None
+                return
 
-        # Load hard-coded standard default assumptions
-        default_streategy_vars = strategy_vars_def.load_param_assump(
-            hard_coded_default_val=True)
+        self.create_folders_rename_folders(config)
 
         # -----------------------------
         # Reading in narrative variables
         # -----------------------------
-        strategy_vars = strategy_vars_def.generate_default_parameter_narratives(
-            default_streategy_vars=default_streategy_vars,
-            end_yr=config['CONFIG']['user_defined_simulation_end_yr'],
-            base_yr=config['CONFIG']['base_yr'])
-
-        user_defined_vars = self._load_narrative_parameters(
-            data_handle,
-            simulation_base_yr=config['CONFIG']['base_yr'],
-            simulation_end_yr=config['CONFIG']['user_defined_simulation_end_yr'],
-            default_streategy_vars=default_streategy_vars)
-
-        strategy_vars = data_loader.replace_variable(user_defined_vars, strategy_vars)
-
-        strategy_vars = strategy_vars_def.autocomplete_strategy_vars(
-            strategy_vars,
-            narrative_crit=True)
+        strategy_vars = self._get_strategy_vars(data_handle, config)
 
         # ------------------------------------------------
         # Load base year scenario data
@@ -295,12 +673,12 @@ class EDWrapper(SectorModel):
         data['scenario_data']['gva_industry'] = defaultdict(dict)
         data['scenario_data']['floor_area'] = defaultdict(dict)
 
-        pop_array_by = data_handle.get_base_timestep_data('population')
-        gva_array_by = data_handle.get_base_timestep_data('gva_per_head')
+        pop_array_by = base_data['population']
+        gva_array_by = base_data['gva_per_head']
         data['regions'] = pop_array_by.spec.dim_coords(region_set_name).ids
 
         # Floor area and service building count inputs (not from virtual dwelling stock)
-        floor_area_curr = data_handle.get_base_timestep_data('floor_area').as_ndarray()
+        floor_area_curr = base_data['floor_area'].as_ndarray()
         data['scenario_data']['rs_floorarea'][curr_yr] = self._assign_array_to_dict(floor_area_curr[:, 0], data['regions'])
         data['scenario_data']['ss_floorarea'][curr_yr] = self._assign_array_to_dict(floor_area_curr[:, 1], data['regions'])
         data['service_building_count'] = {}
@@ -309,10 +687,11 @@ class EDWrapper(SectorModel):
         data['scenario_data']['population'][curr_yr] = self._assign_array_to_dict(pop_array_by.as_ndarray(), data['regions'])
         data['scenario_data']['gva_per_head'][curr_yr] = self._assign_array_to_dict(gva_array_by.as_ndarray(), data['regions'])
 
-        data['reg_coord'] = self._get_coordinates(pop_array_by.spec.dim_coords(region_set_name))
+        data['reg_coord'] = self._get_region_coordinates(data_handle, pop_array_by.spec.dim_coords(region_set_name))
         pop_density = self._calculate_pop_density(pop_array_by, region_set_name)
 
-        data['scenario_data']['gva_industry'][curr_yr] = self._load_gva_sector_data(data_handle, data['regions'])
+        data['scenario_data']['gva_industry'][curr_yr] = self._load_gva_sector_data(
+            data_handle, data['regions'], base_data['gva_per_sector'])
 
         # -----------------------------
         # Load temperatures and weather stations
@@ -362,10 +741,70 @@ class EDWrapper(SectorModel):
         # -----------------------------------------
         # Write pre_simulate to disc
         # ------------------------------------------
-        write_data.write_yaml(regional_vars, os.path.join(temp_path, "regional_vars.yml"))
-        write_data.write_yaml(non_regional_vars, os.path.join(temp_path, "non_regional_vars.yml"))
-        write_data.write_yaml(fuel_disagg, os.path.join(temp_path, "fuel_disagg.yml"))
-        write_data.write_yaml(crit_switch_happening, os.path.join(temp_path, "crit_switch_happening.yml"))
+        write_pre_simulation(
+            {
+                'regional_vars': regional_vars,
+                'non_regional_vars': non_regional_vars,
+                'fuel_disagg': fuel_disagg,
+                'crit_switch_happening': crit_switch_happening
+            },
+            pre_simulation_filename,
+            inputs_hash)
+        self._pre_simulation = None
+
+    def _pre_simulation_inputs_hash(self, data_handle, base_data):
+        """Return a hash of the inputs to before_model_run
+
+        Covers wrapperconfig.ini, the model parameters, the simulation years, the base
+        year data, the temperatures and the energy demand package version. The data
+        files which wrapperconfig.ini points to are taken to be fixed.
+
+        The temperatures are kept loaded, for before_model_run to use if it runs.
+
+        Arguments
+        ---------
+        data_handle : smif.data_layer.DataHandle
+        base_data : dict
+            Base year data arrays, by name
+        """
+        digest = hashlib.sha256()
+        with open(os.path.join(self._get_working_dir(), 'wrapperconfig.ini'), 'rb') as config_file:
+            digest.update(config_file.read())
+        digest.update(getattr(energy_demand, '__version__', '').encode('utf-8'))
+        digest.update(parameter_hash(
+            data_handle, ['mode', 'virtual_dw_stock', 'switches_service'] + NARRATIVE_PARAMETERS
+        ).encode('utf-8'))
+
+        sim_yrs = self._get_simulation_yrs(data_handle)
+        digest.update(pickle.dumps(list(sim_yrs)))
+        for name in sorted(base_data):
+            digest.update(name.encode('utf-8'))
+            digest.update(base_data[name].as_ndarray().tobytes())
+
+        weather_yrs = sim_yrs if self._per_year_weather else [self._weather_yr]
+        for weather_yr in weather_yrs:
+            digest.update(self._temperatures.load(data_handle, weather_yr).tobytes())
+        return digest.hexdigest()
+
+    def _read_pre_simulation(self, path):
+        """Read the results of before_model_run
+
+        The file is read and checked once per process and kept in memory as bytes.
+        Each call unpickles a fresh copy, so changes made while simulating one
+        timestep do not carry over to the next.
+        """
+        filename = os.path.join(path, PRE_SIMULATION_FILENAME)
+        if not os.path.exists(filename + '.sha256'):
+            raise FileNotFoundError(
+                "No results from before_model_run() in {} - run it first".format(path))
+        with open(filename + '.sha256') as hash_file:
+            digest = hash_file.read().strip()
+
+        if self._pre_simulation is None or self._pre_simulation[0] != digest:
+            logging.debug("... reading in results from before_model_run(): " + filename)
+            self._pre_simulation = (digest, read_pre_simulation_payload(filename, digest))
+
+        return pickle.loads(self._pre_simulation[1])
 
     def simulate(self, data_handle):
         """Runs the Energy Demand model for one `timestep`
@@ -385,9 +824,7 @@ class EDWrapper(SectorModel):
         data = {}
 
         region_set_name = self._get_region_set_name()
-        path_main = self._get_working_dir()
-        config_file_path = os.path.join(path_main, 'wrapperconfig.ini')
-        config = data_loader.read_config_file(config_file_path)
+        config = self._read_config(data_handle)
 
         # Replace constrained | unconstrained mode from narrative
         mode = self._get_mode(data_handle)
@@ -413,24 +850,14 @@ class EDWrapper(SectorModel):
         # --------------------------------------------------
         # Read all other data
         # --------------------------------------------------
-        data['scenario_data'] = defaultdict(dict)
-        data['scenario_data']['gva_industry'] = defaultdict(dict)
-        data['scenario_data']['rs_floorarea'] = defaultdict(dict)
-        data['scenario_data']['ss_floorarea'] = defaultdict(dict)
-
         pop_array_by = data_handle.get_base_timestep_data('population')
-        gva_array_by = data_handle.get_base_timestep_data('gva_per_head').as_ndarray()
-
         data['regions'] = pop_array_by.spec.dim_coords(region_set_name).ids
-        data['reg_coord'] = self._get_coordinates(pop_array_by.spec.dim_coords(region_set_name))
+        data['reg_coord'] = self._get_region_coordinates(data_handle, pop_array_by.spec.dim_coords(region_set_name))
 
-        data['scenario_data']['population'][base_yr] = self._assign_array_to_dict(pop_array_by.as_ndarray(), data['regions'])
-        data['scenario_data']['gva_per_head'][base_yr] = self._assign_array_to_dict(gva_array_by, data['regions'])
-        data['scenario_data']['gva_industry'][base_yr] = self._load_gva_sector_data(data_handle, data['regions'])
-
-        floor_area_base = data_handle.get_base_timestep_data('floor_area').as_ndarray()
-        data['scenario_data']['rs_floorarea'][base_yr] = self._assign_array_to_dict(floor_area_base[:, 0], data['regions'])
-        data['scenario_data']['ss_floorarea'][base_yr] = self._assign_array_to_dict(floor_area_base[:, 1], data['regions'])
+        # Base year data does not change within a model run
+        data['scenario_data'] = self._cached(
+            data_handle, 'base_yr_scenario_data', (base_yr, tuple(data['regions'])),
+            lambda: self._load_base_yr_scenario_data(data_handle, base_yr, data['regions']))
 
         # --------------------------------------------
         # Load scenario data for current year
@@ -446,32 +873,20 @@ class EDWrapper(SectorModel):
         data['scenario_data']['rs_floorarea'][curr_yr] = self._assign_array_to_dict(floor_area_curr[:, 0], data['regions'])
         data['scenario_data']['ss_floorarea'][curr_yr] = self._assign_array_to_dict(floor_area_curr[:, 1], data['regions'])
 
-        default_streategy_vars = strategy_vars_def.load_param_assump(
-            hard_coded_default_val=True)
-
-        strategy_vars = strategy_vars_def.generate_default_parameter_narratives(
-            default_streategy_vars=default_streategy_vars,
-            end_yr=config['CONFIG']['user_defined_simulation_end_yr'],
-            base_yr=config['CONFIG']['base_yr'])
-
-        user_defined_vars = self._load_narrative_parameters(
-            data_handle,
-            simulation_base_yr=config['CONFIG']['base_yr'],
-            simulation_end_yr=config['CONFIG']['user_defined_simulation_end_yr'],
-            default_streategy_vars=default_streategy_vars)
-
-        strategy_vars = data_loader.replace_variable(user_defined_vars, strategy_vars)
-
-        # Replace strategy variables not defined in csv files)
-        strategy_vars = strategy_vars_def.autocomplete_strategy_vars(
-            strategy_vars,
-            narrative_crit=True)
+        strategy_vars = self._get_strategy_vars(data_handle, config)
 
         # -----------------------------
         # Load temperatures
         # -----------------------------
+        if self._per_year_weather:
+            # The model reads the temperatures of the base and current years only,
+            # so hold just those rather than every simulation year
+            temp_yrs = sorted(set([base_yr, curr_yr]))
+            self._temperatures.retain(temp_yrs)
+        else:
+            temp_yrs = sim_yrs
         data['temp_data'] = self._get_temperatures(
-            data_handle, sim_yrs, data['regions'], constant_weather=False)
+            data_handle, temp_yrs, data['regions'], constant_weather=False)
 
         # -----------------------------------------
         # Load data
@@ -483,6 +898,11 @@ class EDWrapper(SectorModel):
             curr_yr)
         data['assumptions'].update('strategy_vars', strategy_vars)
 
+        weather_by = data['assumptions'].weather_by
+        if weather_by not in data['temp_data']:
+            data['temp_data'].update(self._get_temperatures(
+                data_handle, [weather_by], data['regions'], constant_weather=False))
+
         # -----------------------------------------
         # Specific region selection
         # -----------------------------------------
@@ -494,14 +914,11 @@ class EDWrapper(SectorModel):
         # --------------------------------------------------
         # Read results from pre_simulate from disc
         # --------------------------------------------------
-        logging.debug("... reading in results from before_model_run(): " + str(temp_and_result_path))
-        regional_vars = read_data.read_yaml(os.path.join(temp_and_result_path, "regional_vars.yml"))
-        non_regional_vars = read_data.read_yaml(os.path.join(temp_and_result_path, "non_regional_vars.yml"))
-        data['fuel_disagg'] = read_data.read_yaml(os.path.join(temp_and_result_path, "fuel_disagg.yml"))
-        crit_switch_happening = read_data.read_yaml(os.path.join(temp_and_result_path, "crit_switch_happening.yml"))
-        setattr(data['assumptions'], 'crit_switch_happening', crit_switch_happening)
-        setattr(data['assumptions'], 'regional_vars', regional_vars)
-        setattr(data['assumptions'], 'non_regional_vars', non_regional_vars)
+        pre_simulation = self._read_pre_simulation(temp_and_result_path)
+        data['fuel_disagg'] = pre_simulation['fuel_disagg']
+        setattr(data['assumptions'], 'crit_switch_happening', pre_simulation['crit_switch_happening'])
+        setattr(data['assumptions'], 'regional_vars', pre_simulation['regional_vars'])
+        setattr(data['assumptions'], 'non_regional_vars', pre_simulation['non_regional_vars'])
 
         # --------------------------------------------------
         # Update depending on narratives
@@ -517,36 +934,327 @@ class EDWrapper(SectorModel):
         # --------------------------------------------------
         # Run main model function
         # --------------------------------------------------
-        sim_obj = energy_demand_model(
-            region_selection,
-            data,
-            config['CRITERIA'],
-            data['assumptions'],
-            weather_yr=weather_yr,
-            weather_by=data['assumptions'].weather_by)
-
-        # --------------------------------------------------
-        # Write other results to txt files
-        # --------------------------------------------------
-        wrapper_model.write_user_defined_results(
-            config['CRITERIA'],
-            data['result_paths'],
-            sim_obj,
-            data,
-            curr_yr,
-            region_selection,
-            pop_array_cy)
+        if self._processes == 1:
+            sim_obj = energy_demand_model(
+                region_selection,
+                data,
+                config['CRITERIA'],
+                data['assumptions'],
+                weather_yr=weather_yr,
+                weather_by=weather_by)
+            supply_results = sim_obj.supply_results
+
+            # --------------------------------------------------
+            # Write other results to txt files
+            # --------------------------------------------------
+            if self._write_text_results:
+                wrapper_model.write_user_defined_results(
+                    config['CRITERIA'],
+                    data['result_paths'],
+                    sim_obj,
+                    data,
+                    curr_yr,
+                    region_selection,
+                    pop_array_cy)
+            del sim_obj
+        else:
+            region_axes = {
+                key_name: spec.dims.index(region_set_name)
+                for key_name, spec in self.outputs.items()
+            }
+            supply_results = simulate_regions_in_parallel(
+                region_selection,
+                self._processes,
+                region_axes,
+                data,
+                config['CRITERIA'],
+                data['assumptions'],
+                weather_yr=weather_yr,
+                weather_by=weather_by)
+
+            if self._check_processes and not self._processes_checked:
+                logging.info("... checking results against simulating in one process")
+                serial_results = energy_demand_model(
+                    region_selection,
+                    data,
+                    config['CRITERIA'],
+                    data['assumptions'],
+                    weather_yr=weather_yr,
+                    weather_by=weather_by).supply_results
+                differ = results_differ(serial_results, supply_results)
+                if differ:
+                    raise ValueError(
+                        "Simulating regions in {} processes changed results {}, "
+                        "set processes = 1".format(self._processes, ', '.join(differ)))
+                del serial_results
+                self._processes_checked = True
 
         # --------------------------------------------------
         # Pass results to supply model and smif
         # --------------------------------------------------
         for key_name in self.outputs:
-            if key_name in sim_obj.supply_results.keys():
-                logging.debug("...writing `{}` to smif".format(key_name))
-                single_result = sim_obj.supply_results[key_name]
-                data_handle.set_results(key_name, single_result)
-            else:
-                logging.info(" '{}' is not provided and thus replaced with empty values".format(key_name))
-                #data_handle.set_results(key_name, np.zeros((391, 8760)))
+            if key_name not in supply_results.keys():
                 logging.info(" '{}' is not in outputs".format(key_name))
                 raise Exception("Output '{}' is not defined".format(key_name))
+
+        # Hand over one result at a time and drop it, so results are freed as they go
+        for key_name, spec in self.outputs.items():
+            logging.debug("...writing `{}` to smif".format(key_name))
+            single_result = supply_results.pop(key_name)
+            if self._output_precision == np.float32 and 'hourly' in spec.dims:
+                single_result = to_float32(key_name, single_result, self._float32_rtol)
+            data_handle.set_results(key_name, single_result)
+            del single_result
+
+
+def write_pre_simulation(state, filename, inputs_hash=None):
+    """Write the results of before_model_run to a binary file
+
+    The state is pickled to `filename` and the SHA-256 hash of its contents is
+    written to `filename` + ``.sha256``, after the data, so a complete hash file
+    marks a complete write. If given, the hash of the inputs the state was computed
+    from is written last, to `filename` + ``.inputs``, and otherwise any earlier
+    inputs hash is removed.
+
+    Arguments
+    ---------
+    state : dict
+    filename : str
+    inputs_hash : str, default=None
+
+    Returns
+    -------
+    str
+        The content hash
+    """
+    payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    digest = hashlib.sha256(payload).hexdigest()
+    with open(filename, 'wb') as data_file:
+        data_file.write(payload)
+    with open(filename + '.sha256', 'w') as hash_file:
+        hash_file.write(digest)
+    if inputs_hash is not None:
+        with open(filename + '.inputs', 'w') as inputs_file:
+            inputs_file.write(inputs_hash)
+    elif os.path.exists(filename + '.inputs'):
+        os.remove(filename + '.inputs')
+    return digest
+
+
+def pre_simulation_is_current(filename, inputs_hash):
+    """Check for complete results of before_model_run computed from the same inputs
+
+    Arguments
+    ---------
+    filename : str
+        As passed to ``write_pre_simulation``
+    inputs_hash : str
+
+    Returns
+    -------
+    bool
+    """
+    try:
+        with open(filename + '.inputs') as inputs_file:
+            if inputs_file.read().strip() != inputs_hash:
+                return False
+        with open(filename + '.sha256') as hash_file:
+            read_pre_simulation_payload(filename, hash_file.read().strip())
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def read_pre_simulation_payload(filename, digest):
+    """Read the pickled results of before_model_run, checking their content hash
+
+    Returns
+    -------
+    bytes
+
+    Raises
+    ------
+    ValueError
+        If the file contents do not match `digest`
+    """
+    with open(filename, 'rb') as data_file:
+        payload = data_file.read()
+    if hashlib.sha256(payload).hexdigest() != digest:
+        raise ValueError(
+            "{} does not match its content hash - run before_model_run again".format(
+                filename))
+    return payload
+
+
+def parameter_digests(data_handle, names):
+    """Return a hash of the values of each of some model parameters
+
+    Hashes the arrays smif holds for the parameters, without converting them.
+
+    Arguments
+    ---------
+    data_handle : smif.data_layer.DataHandle
+    names : list
+        Parameter names
+
+    Returns
+    -------
+    dict
+        Maps each parameter name to a hash of its name and values
+    """
+    digests = {}
+    for name in names:
+        array = data_handle.get_parameter(name).as_ndarray()
+        digest = hashlib.sha256()
+        digest.update(name.encode('utf-8'))
+        digest.update(pickle.dumps((array.dtype.str, array.shape)))
+        if array.dtype.hasobject:
+            digest.update(pickle.dumps(array, protocol=pickle.HIGHEST_PROTOCOL))
+        else:
+            digest.update(np.ascontiguousarray(array))
+        digests[name] = digest.hexdigest()
+    return digests
+
+
+def parameter_hash(data_handle, names):
+    """Return a hash of the values of some model parameters
+
+    Arguments
+    ---------
+    data_handle : smif.data_layer.DataHandle
+    names : list
+        Parameter names
+
+    Returns
+    -------
+    str
+    """
+    digests = parameter_digests(data_handle, names)
+    return hashlib.sha256(
+        ''.join(digests[name] for name in names).encode('utf-8')).hexdigest()
+
+
+def simulate_regions_in_parallel(region_selection, processes, region_axes, data, criterias,
+                                 assumptions, weather_yr, weather_by):
+    """Run the energy demand model for chunks of regions in a pool of processes
+
+    The model inputs are shared with forked worker processes copy-on-write, so
+    only region names are sent to the workers, and only supply results come back.
+
+    Arguments
+    ---------
+    region_selection : list
+        Regions to simulate
+    processes : int
+        Number of worker processes, and of chunks of regions
+    region_axes : dict
+        Maps each supply result to simulate to the position of its region dimension
+    data, criterias, assumptions, weather_yr, weather_by
+        As passed to ``energy_demand.main.energy_demand_model``
+
+    Returns
+    -------
+    dict
+        Maps each result in `region_axes` to an array covering all of `region_selection`
+    """
+    global _SHARED_MODEL_INPUTS
+
+    chunk_size = -(-len(region_selection) // processes)
+    chunks = [
+        region_selection[start:start + chunk_size]
+        for start in range(0, len(region_selection), chunk_size)
+    ]
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        raise RuntimeError("Simulating regions in parallel needs 'fork' process start-up")
+
+    logging.info("... simulating %s regions in %s processes", len(region_selection), len(chunks))
+    _SHARED_MODEL_INPUTS = (data, criterias, assumptions, weather_yr, weather_by, region_axes)
+    try:
+        with context.Pool(len(chunks)) as pool:
+            chunk_results = pool.map(_simulate_regions, chunks)
+    finally:
+        _SHARED_MODEL_INPUTS = None
+
+    # Merge one result at a time, dropping the chunks as they are merged
+    supply_results = {}
+    for key_name, axis in region_axes.items():
+        if all(key_name in results for results in chunk_results):
+            supply_results[key_name] = np.concatenate(
+                [results.pop(key_name) for results in chunk_results], axis=axis)
+    return supply_results
+
+
+def _simulate_regions(regions):
+    """Simulate a chunk of regions in a worker process
+    """
+    data, criterias, assumptions, weather_yr, weather_by, region_axes = _SHARED_MODEL_INPUTS
+    setattr(assumptions, 'reg_nrs', len(regions))
+    sim_obj = energy_demand_model(
+        regions,
+        data,
+        criterias,
+        assumptions,
+        weather_yr=weather_yr,
+        weather_by=weather_by)
+    return {
+        key_name: sim_obj.supply_results[key_name]
+        for key_name in region_axes if key_name in sim_obj.supply_results
+    }
+
+
+def results_differ(expected, actual, rtol=1e-9):
+    """Return the names of the results in `actual` which differ from `expected`
+
+    Arguments
+    ---------
+    expected : dict
+        Supply results simulated in one process
+    actual : dict
+        Supply results simulated in chunks of regions and merged
+    rtol : float, default=1e-9
+        Relative tolerance for differences in floating point rounding
+    """
+    return [
+        key_name for key_name, result in actual.items()
+        if key_name not in expected
+        or np.shape(expected[key_name]) != np.shape(result)
+        or not np.allclose(expected[key_name], result, rtol=rtol, atol=0, equal_nan=True)
+    ]
+
+
+def to_float32(name, result, rtol):
+    """Convert a result to float32, checking that it keeps its values
+
+    Arguments
+    ---------
+    name : str
+        Name of the result, for error messages
+    result : numpy.ndarray
+    rtol : float
+        Relative tolerance for each value, and for the total of all values
+
+    Returns
+    -------
+    numpy.ndarray
+
+    Raises
+    ------
+    ValueError
+        If a value overflows or is not within `rtol` of the original, or the total
+        changes by more than `rtol`
+    """
+    with np.errstate(over='ignore'):
+        compact = np.asarray(result).astype(np.float32)
+    if not np.array_equal(np.isfinite(compact), np.isfinite(result)):
+        raise ValueError("Result '{}' overflows float32".format(name))
+    if not np.allclose(compact, result, rtol=rtol, atol=np.finfo(np.float32).tiny):
+        raise ValueError("Result '{}' is not within {} of its float32 values".format(
+            name, rtol))
+
+    total = np.sum(result, dtype=np.float64)
+    if not np.isclose(np.sum(compact, dtype=np.float64), total, rtol=rtol):
+        raise ValueError("Total of result '{}' is not within {} in float32".format(
+            name, rtol))
+    return compact
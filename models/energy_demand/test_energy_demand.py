@@ -0,0 +1,294 @@
+"""Tests for the energy demand wrapper
+"""
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('energy_demand')
+pytest.importorskip('smif')
+
+
+def load_wrapper_module():
+    """Import run.py under its own name, as other model directories have a run.py too
+    """
+    spec = importlib.util.spec_from_file_location(
+        'energy_demand_run', os.path.join(os.path.dirname(__file__), 'run.py'))
+    module = importlib.util.module_from_spec(spec)
+    # Registered so that worker processes can find its functions
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+run = load_wrapper_module()
+
+
+class DummyDataArray(object):
+    def __init__(self, array):
+        self.array = array
+
+    def as_ndarray(self):
+        return self.array
+
+
+class DummyDataHandle(object):
+    """Returns temperatures of 2 regions by 24 hours, recording the years read
+    """
+    def __init__(self):
+        self.calls = []
+
+    def get_data(self, name, timestep=None):
+        self.calls.append((name, timestep))
+        offset = 0.5 if name == 't_max' else 0
+        return DummyDataArray(np.full((2, 24), timestep + offset))
+
+
+def test_temperature_provider_caches():
+    provider = run.TemperatureProvider()
+    data_handle = DummyDataHandle()
+
+    first = provider.load(data_handle, 2015)
+    assert provider.load(data_handle, 2015) is first
+    assert data_handle.calls == [('t_min', 2015), ('t_max', 2015)]
+    np.testing.assert_equal(first[1], np.full((2, 24), 2015.5))
+    with pytest.raises(ValueError):
+        first[0, 0, 0] = 0
+
+
+def test_temperature_provider_memmaps_above_total():
+    """Arrays are memory-mapped once the arrays in memory reach the limit together
+    """
+    array_bytes = 2 * 2 * 24 * 8
+    provider = run.TemperatureProvider(memmap_bytes=int(2.5 * array_bytes))
+    data_handle = DummyDataHandle()
+
+    arrays = [provider.load(data_handle, year) for year in [2015, 2016, 2017]]
+
+    assert [isinstance(array, np.memmap) for array in arrays] == [False, False, True]
+    np.testing.assert_equal(arrays[2][0], np.full((2, 24), 2017))
+
+
+def test_temperature_provider_retain():
+    array_bytes = 2 * 2 * 24 * 8
+    provider = run.TemperatureProvider(memmap_bytes=array_bytes)
+    data_handle = DummyDataHandle()
+
+    provider.load(data_handle, 2015)
+    filename = provider.load(data_handle, 2016).filename
+    assert os.path.exists(filename)
+
+    provider.retain([2016])
+    assert provider.weather_yrs == [2016]
+
+    # the memory of the evicted array is free again
+    assert not isinstance(provider.load(data_handle, 2017), np.memmap)
+
+    provider.retain([2017])
+    assert provider.weather_yrs == [2017]
+    assert not os.path.exists(filename)
+
+
+class DummyInputsHandle(DummyDataHandle):
+    """Provides the inputs hashed for before_model_run
+    """
+    timesteps = [2015, 2016]
+
+    def get_parameter(self, name):
+        return DummyDataArray(np.zeros(1))
+
+    def get_base_timestep_data(self, name):
+        return DummyDataArray(np.ones((2, 3)))
+
+
+def test_pre_simulation_inputs_hash_keeps_temperatures(tmpdir, monkeypatch):
+    """The temperatures hashed are loaded once, and used to set up the model run
+    """
+    tmpdir.join('wrapperconfig.ini').write('[CONFIG]\n')
+    wrapper = run.EDWrapper('energy_demand')
+    wrapper._per_year_weather = True
+    monkeypatch.setattr(wrapper, '_get_working_dir', lambda: str(tmpdir))
+    data_handle = DummyInputsHandle()
+    base_data = {name: data_handle.get_base_timestep_data(name) for name in ['population']}
+
+    inputs_hash = wrapper._pre_simulation_inputs_hash(data_handle, base_data)
+    assert inputs_hash == wrapper._pre_simulation_inputs_hash(data_handle, base_data)
+    assert len(data_handle.calls) == 4
+
+    wrapper._get_temperatures(data_handle, [2015, 2016], ['A', 'B'])
+    assert len(data_handle.calls) == 4
+
+
+def test_write_pre_simulation_inputs_hash(tmpdir):
+    filename = str(tmpdir.join(run.PRE_SIMULATION_FILENAME))
+
+    run.write_pre_simulation({'a': 1}, filename, 'inputs')
+    assert run.pre_simulation_is_current(filename, 'inputs')
+    assert not run.pre_simulation_is_current(filename, 'other inputs')
+
+    # results written without an inputs hash are not reused
+    run.write_pre_simulation({'a': 2}, filename)
+    assert not run.pre_simulation_is_current(filename, 'inputs')
+
+
+class DummyAssumptions(object):
+    pass
+
+
+class DummyModel(object):
+    """Stands in for the energy demand model, with results by region and hour
+    """
+    def __init__(self, regions, data, criterias, assumptions, weather_yr, weather_by):
+        position = np.array([data['regions'].index(region) for region in regions], float)
+        # a share of the total of the regions simulated together
+        share = position / max(position.sum(), 1)
+        self.supply_results = {
+            'by_region': np.outer(position, np.arange(24)),
+            'by_hour': np.outer(np.arange(24), position + weather_yr),
+            'share': np.outer(share, np.ones(24)),
+        }
+
+
+def test_simulate_regions_in_parallel(monkeypatch):
+    monkeypatch.setattr(run, 'energy_demand_model', DummyModel)
+    regions = ['E{:02d}'.format(number) for number in range(10)]
+    data = {'regions': regions}
+    region_axes = {'by_region': 0, 'by_hour': 1, 'share': 0}
+
+    serial = DummyModel(regions, data, None, DummyAssumptions(), 2015, 2015).supply_results
+    parallel = run.simulate_regions_in_parallel(
+        regions, 3, region_axes, data, None, DummyAssumptions(), 2015, 2015)
+
+    assert sorted(parallel) == ['by_hour', 'by_region', 'share']
+    # results which depend on which regions are simulated together are caught
+    assert run.results_differ(serial, parallel) == ['share']
+
+
+def test_results_differ():
+    expected = {'a': np.array([[1.0, np.nan]]), 'b': np.ones((2, 3))}
+
+    assert run.results_differ(expected, {'a': np.array([[1.0 + 1e-12, np.nan]])}) == []
+    assert run.results_differ(expected, {'a': np.array([[1.1, np.nan]])}) == ['a']
+    assert run.results_differ(expected, {'b': np.ones((3, 2))}) == ['b']
+    assert run.results_differ(expected, {'c': np.ones(1)}) == ['c']
+
+
+def test_processes_with_text_results(tmpdir):
+    config = tmpdir.join('run_config.ini')
+    wrapper = run.EDWrapper.__new__(run.EDWrapper)
+    wrapper._config_filename = str(config)
+
+    config.write('[run]\nprocesses = 4\nwrite_text_results = true\n')
+    with pytest.raises(ValueError):
+        wrapper._set_options()
+
+    config.write('[run]\nprocesses = 4\nwrite_text_results = false\n')
+    wrapper._set_options()
+    assert wrapper._processes == 4
+
+
+def test_to_float32():
+    result = np.array([[0.1, 2.5e6], [1e-30, -3.0]])
+
+    compact = run.to_float32('result', result, rtol=1e-6)
+
+    assert compact.dtype == np.float32
+    np.testing.assert_allclose(compact, result, rtol=1e-6)
+
+
+def test_to_float32_outside_tolerance():
+    result = np.array([1 + 1e-9, 2.0])
+
+    with pytest.raises(ValueError, match='not within'):
+        run.to_float32('result', result, rtol=1e-12)
+
+
+def test_to_float32_total_outside_tolerance():
+    """Each value is within tolerance, but the total is not
+    """
+    result = np.array([1e8 + 0.3, -1e8])
+
+    with pytest.raises(ValueError, match='Total'):
+        run.to_float32('result', result, rtol=1e-6)
+
+
+def test_to_float32_overflow():
+    with pytest.raises(ValueError, match='overflows'):
+        run.to_float32('result', np.array([1e39]), rtol=1e-6)
+
+
+class DummyParameter(object):
+    def __init__(self, values):
+        self.values = values
+
+    def as_df(self):
+        return pd.Series(self.values, index=pd.Index([2015, 2050], name='timestep'))
+
+    def as_ndarray(self):
+        return np.array(self.values)
+
+
+class DummyParameterHandle(object):
+    """Returns the same values for every parameter, apart from any in `values`
+    """
+    def __init__(self, values=None):
+        self.values = values or {}
+
+    def get_parameter(self, name):
+        return DummyParameter(self.values.get(name, [0.0, 1.0]))
+
+
+@pytest.fixture
+def read_narratives(monkeypatch):
+    """Record the narrative parameters read, with an empty registry for the process
+    """
+    calls = []
+
+    def read_user_defined_param(df_raw, **kwargs):
+        calls.append(kwargs['var_name'])
+        return {'values': list(df_raw.iloc[:, -1])}
+
+    monkeypatch.setattr(
+        run.narrative_related, 'read_user_defined_param', read_user_defined_param)
+    monkeypatch.setattr(run, '_NARRATIVE_REGISTRY', run.OrderedDict())
+    return calls
+
+
+def test_narrative_parameters_registry(read_narratives):
+    """Narrative parameters are read once per process, whichever wrapper reads them
+    """
+    var_name, other_name = run.NARRATIVE_PARAMETERS[:2]
+    defaults = {var_name: 0.5, other_name: 0.5}
+
+    wrapper = run.EDWrapper('energy_demand')
+    for _ in range(2):
+        parameters = wrapper._load_narrative_parameters(
+            DummyParameterHandle(), 2015, 2050, defaults)
+        assert parameters[var_name] == {'values': [0.0, 1.0]}
+    assert read_narratives == [var_name]
+
+    # another model run, which changes one narrative
+    other_wrapper = run.EDWrapper('energy_demand')
+    data_handle = DummyParameterHandle({other_name: [0.0, 2.0]})
+    parameters = other_wrapper._load_narrative_parameters(data_handle, 2015, 2050, defaults)
+    assert parameters[var_name] == {'values': [0.0, 1.0]}
+    assert parameters[other_name] == {'values': [0.0, 2.0]}
+    assert read_narratives == [var_name, other_name]
+    assert len(run._NARRATIVE_REGISTRY) == 2
+
+
+def test_narrative_parameters_registry_size(read_narratives):
+    var_name = run.NARRATIVE_PARAMETERS[0]
+    registry = run.OrderedDict()
+
+    for values in [[0.0, 1.0], [0.0, 2.0], [0.0, 3.0], [0.0, 1.0]]:
+        data_handle = DummyParameterHandle({var_name: values})
+        run.NarrativeParameters(
+            data_handle, 2015, 2050, {var_name: 0.5}, registry=registry, size=2)[var_name]
+
+    # the first value was dropped to keep two, so is read again
+    assert len(registry) == 2
+    assert read_narratives == [var_name] * 4
@@ -1,12 +1,24 @@
 """Energy supply wrapper
 """
+import atexit
+import hashlib
+import io
+import json
 import os
+import queue
+import re
+import threading
+import time
 from configparser import ConfigParser
-from subprocess import check_output
+from contextlib import contextmanager
+from functools import lru_cache
+from subprocess import PIPE, STDOUT, CalledProcessError, Popen, TimeoutExpired
 
 import numpy as np
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import sql
 from smif.model.sector_model import SectorModel
 
 
@@ -15,6 +27,12 @@ try:
 except ImportError:
     pass
 
+try:
+    import pyarrow as pa  # import to enable exporting outputs
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
 
 def profile(func):
     """Decorator - add to a function to profile cpu usage (requires pyinstrument):
@@ -33,30 +51,151 @@ def profile(func):
     return wrapper
 
 
+# Input parameters written to input_annual, by region
+INPUTS_ANNUAL = ['EV_Cap', 'biomass_feedstock', 'municipal_waste', 'elec_int']
+
+# Input parameters written to input_timestep, by region and interval, if connected
+INPUTS_TIMESTEP = [
+    # both modes
+    'elecload',
+    'gasload',
+    'gasload_non_heat_res',
+    'elecload_non_heat_res',
+    'gasload_non_heat_com',
+    'elecload_non_heat_com',
+    'hydrogenload_non_heat_eh',
+    'oil_non_heat_eh',
+    'solid_fuel_non_heat_eh',
+    # optimised mode only
+    'heatload_res',
+    'heatload_com',
+    # constrained mode only
+    'building_biomass_boiler',
+    'building_elec_boiler',
+    'building_heatpump',
+    'building_gas_boiler',
+    'building_hydrogen_boiler',
+    'building_oil_boiler',
+    'building_solidfuel_boiler',
+    'dh_biomass_boiler',
+    'dh_elec_boiler',
+    'dh_gas_CHP',
+    'dh_hydrogen_fuelcell',
+    #weather_data
+    'wind_speed_eh',
+    'wind_speed_bus',
+    'insolation_eh',
+    'insolation_bus',
+    #transport
+    'elec_trans',
+    'hydrogen_trans',
+]
+
+
 class EnergySupplyWrapper(SectorModel):
     """Energy supply
     """
+    _config_filename = 'run_config.ini'
+
+    def __init__(self, *args, **kwargs):
+        self._set_options()
+        self._solver = None
+        # Database schema for this model run, if runs are isolated
+        self._schema = None
+        super().__init__(*args, **kwargs)
+
+    def _set_options(self):
+        config = ConfigParser()
+        config.read(os.path.join(os.path.dirname(__file__), self._config_filename))
+        if 'run' not in config:
+            config['run'] = {}
+
+        self._incremental_interventions = config['run'].getboolean(
+            'incremental_interventions', fallback=False)
+        self._persistent_solver = config['run'].getboolean(
+            'persistent_solver', fallback=False)
+        self._solver_timeout = config['run'].getfloat('solver_timeout', fallback=None)
+        self._isolate_model_runs = config['run'].getboolean(
+            'isolate_model_runs', fallback=False)
+        self._write_metrics = config['run'].getboolean('write_metrics', fallback=False)
+        self._export_outputs = config['run'].getboolean('export_outputs', fallback=False)
+        if self._export_outputs and pa is None:
+            raise ImportError("export_outputs requires pyarrow to be installed")
 
     def before_model_run(self, data):
-        pass
+        self._set_schema(data)
+
+    def _set_schema(self, data_handle):
+        """Create or reuse the database schema for this model run, if isolated
+
+        Each model run reads and writes its own copy of the energy supply tables, so
+        several model runs can share one database at the same time.
+        """
+        if not self._isolate_model_runs or self._schema is not None:
+            return
+
+        schema = model_run_schema(data_handle._modelrun_name)
+        with database_session() as conn:
+            parameters = INPUTS_ANNUAL + [name for name in INPUTS_TIMESTEP if name in self.inputs]
+            if create_schema(schema, conn, parameters):
+                self.logger.info("Created database schema %s", schema)
+            else:
+                self.logger.info("Using existing database schema %s", schema)
+        self._schema = schema
 
     def simulate(self, data):
         """Run the energy supply operational simulation
+
+        All writes for the timestep run in a single transaction, which is committed
+        before the solver is started, so a failure in any phase leaves the database
+        as it was at the end of the previous timestep.
         """
         # Get the current timestep
         now = data.current_timestep
-        clear_results(now)
-        write_simduration(now)
-        self.get_model_parameters(data)
-
-        self.clear_input_tables()
-
-        self.build_interventions(data, now)
-        self.get_model_inputs(data)
-        self.run_the_model()
-        self.retrieve_outputs(data, now)
+        self._set_schema(data)
+
+        metrics = TimestepMetrics(now)
+
+        with database_session(self._schema) as conn:
+            with savepoint(conn, 'clear_results'), metrics.phase('clear') as record:
+                record['rows'] = clear_results(now, conn)
+                write_simduration(now, conn)
+            with savepoint(conn, 'parameters'), metrics.phase('flags'):
+                self.get_model_parameters(data, conn)
+            with savepoint(conn, 'clear_input_tables'), \
+                    metrics.phase('clear_input_tables'):
+                self.clear_input_tables(conn, self._incremental_interventions)
+            with savepoint(conn, 'interventions'), \
+                    metrics.phase('interventions') as record:
+                loaded_interventions = self.build_interventions(
+                    data, now, conn, self._incremental_interventions)
+                record['rows'] = sum(len(rows) for rows in loaded_interventions.values())
+            with savepoint(conn, 'inputs'):
+                self.get_model_inputs(data, conn, metrics)
+
+        with metrics.phase('solve'):
+            self.run_the_model()
+
+        with database_session(self._schema) as conn:
+            self.retrieve_outputs(data, now, conn, metrics)
+
+        self.logger.info(
+            "Energy supply timestep %s took %.1fs, of which %.1fs solving",
+            now, metrics.seconds(), metrics.seconds('solve'))
+        if self._write_metrics:
+            metrics.write(self._results_path(data, 'metrics', 'timestep_{}.json'.format(now)))
+
+    def _results_path(self, data_handle, *parts):
+        """Path of a file kept with the results of this model run
+
+        Files kept with the model run results travel with them between ``smif step``
+        runs.
+        """
+        nismod_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        return os.path.join(
+            nismod_dir, 'results', data_handle._modelrun_name, self.name, *parts)
 
-    def get_model_parameters(self, data):
+    def get_model_parameters(self, data, conn):
         # Get model parameters
         load_shed_elec = float(data.get_parameter('LoadShed_elec').as_ndarray())
         self.logger.debug('Parameter Loadshed elec: %s', load_shed_elec)
@@ -91,31 +230,45 @@ class EnergySupplyWrapper(SectorModel):
         interconnector_neutral = int(data.get_parameter('interconnector_neutral').as_ndarray())
         self.logger.debug('Parameter interconnector_neutral: %s', interconnector_neutral)
 
-        with establish_connection() as conn:
-            write_load_shed_costs(load_shed_elec, load_shed_gas, conn)
-            write_flags(heat_technology_mode,operation_mode,heat_supply_strategy,sensitivity_mode,emissions_constraint,ev_smart_charging,ev_vehicle_to_grid,unit_commitment,interconnector_neutral,conn)
-
-        conn.close()
-
+        write_load_shed_costs(load_shed_elec, load_shed_gas, conn)
+        write_flags(heat_technology_mode,operation_mode,heat_supply_strategy,sensitivity_mode,emissions_constraint,ev_smart_charging,ev_vehicle_to_grid,unit_commitment,interconnector_neutral,conn)
 
-    def clear_input_tables(self):
+    def clear_input_tables(self, conn, keep_interventions=False):
         """Removes all state data from database tables
 
         Removes data from:
-        - GeneratorData
         - WindPVData_EH
         - WindPVData_Tran
-        - GasStorage
+        - GeneratorData, GasStorage, PipeData, LineData and HeatTechData, unless
+          `keep_interventions` is True, as when these are updated incrementally
+        """
+        delete_from("WindPVData_EH", conn)
+        delete_from("WindPVData_Tran", conn)
+        if keep_interventions:
+            return
+        delete_from("GeneratorData", conn)
+        delete_from("GasStorage", conn)
+        delete_from("PipeData", conn)
+        delete_from("LineData", conn)
+        delete_from("HeatTechData", conn)
+
+    def build_interventions(self, data, current_timestep, conn, incremental=False):
+        """Write the current interventions to the input tables
+
+        Arguments
+        ---------
+        data : smif.data_layer.DataHandle
+        current_timestep : int
+        conn : psycopg2.extensions.connection
+        incremental : bool, default=False
+            If True, only rows which differ from the rows in each table are written,
+            otherwise each table is rewritten in full.
+
+        Returns
+        -------
+        dict
+            The rows now in each intervention table, by table name
         """
-        delete_from("GeneratorData")
-        delete_from("WindPVData_EH")
-        delete_from("WindPVData_Tran")
-        delete_from("GasStorage")
-        delete_from("PipeData")
-        delete_from("LineData")
-        delete_from("HeatTechData")
-
-    def build_interventions(self, data, current_timestep):
         # Build interventions
         current_interventions = data.get_current_interventions()
 
@@ -153,84 +306,88 @@ class EnergySupplyWrapper(SectorModel):
             else:
                 print("Not sure what to do with {}".format(name))
 
-        self.logger.debug("Writing %s pipes to database", len(pipes))
-        build_pipes(pipes, current_timestep)
-        self.logger.debug("Writing %s lines to database", len(lines))
-        build_lines(lines, current_timestep)
-        self.logger.debug('Writing %s gas stores to database', len(gas_stores))
-        build_gas_stores(gas_stores, current_timestep)
-        self.logger.debug('Writing %s gas terminals to database', len(gasterminal))
-        build_gas_terminals(gasterminal, current_timestep)
-        self.logger.debug('Building %s generators', len(generators))
-        build_generator(generators, current_timestep)
-        self.logger.debug('Building %s heattech interventions', len(heattech))
-        build_heattech(heattech, current_timestep)
-
-        self.logger.debug('Retiring %s generators', len(retirees))
-        retire_generator(retirees)
-
-    def get_model_inputs(self, data):
+        # Validate and convert every intervention before writing anything
+        to_rows = [
+            ("PipeData", pipe_rows, pipes),
+            ("LineData", line_rows, lines),
+            ("GasStorage", gas_store_rows, gas_stores),
+            ("GasTerminal", gas_terminal_rows, gasterminal),
+            ("GeneratorData", generator_rows, generators),
+            ("HeatTechData", heattech_rows, heattech),
+        ]
+        table_rows = []
+        errors = []
+        for table_name, convert, interventions in to_rows:
+            try:
+                table_rows.append((table_name, convert(interventions, current_timestep)))
+            except ValueError as ex:
+                errors.append("{}: {}".format(table_name, ex))
+        if errors:
+            raise ValueError("Invalid interventions\n" + "\n".join(errors))
+
+        # Retired plants are left out of GeneratorData
+        retired = set(str(plant['name']) for plant in retirees)
+        self.logger.debug('Retiring %s generators', len(retired))
+        table_rows = [
+            (table_name, [row for row in rows if str(row["GeneratorName"]) not in retired])
+            if table_name == "GeneratorData" else (table_name, rows)
+            for table_name, rows in table_rows
+        ]
+
+        for table_name, rows in table_rows:
+            if incremental:
+                inserted, deleted, updated = update_rows(table_name, rows, conn)
+                self.logger.debug(
+                    "Updating %s: %s rows inserted, %s deleted, %s updated",
+                    table_name, inserted, deleted, updated)
+            else:
+                self.logger.debug("Writing %s rows to %s", len(rows), table_name)
+                replace_rows(table_name, rows, conn)
+
+        return dict(table_rows)
+
+    def get_model_inputs(self, data, conn, metrics=None):
         # Get model inputs
         self.logger.debug("Energy Supply Wrapper received inputs in %s", data.current_timestep)
+        if metrics is None:
+            metrics = TimestepMetrics(data.current_timestep)
 
-        fuel_prices = data.get_data("fuel_price")
-        self.logger.debug('Input price: %s', fuel_prices)
-        write_prices(fuel_prices, data.current_timestep)
+        with metrics.phase('inputs/fuel_price') as record:
+            fuel_prices = data.get_data("fuel_price")
+            self.logger.debug('Input price: %s', fuel_prices)
+            record['rows'] = write_prices(fuel_prices, data.current_timestep, conn)
+            record['bytes'] = fuel_prices.as_ndarray().nbytes
 
         # inputs with just region
-        param_name_annual = ['EV_Cap', 'biomass_feedstock','municipal_waste','elec_int']
-        for param_name in param_name_annual :
-            param_data = data.get_data(param_name)
-            write_input_annual(param_data, param_name, data.current_timestep)
-
-        inputs_with_region_and_interval = [
-            # both modes
-            'elecload',
-            'gasload',
-            'gasload_non_heat_res',
-            'elecload_non_heat_res',
-            'gasload_non_heat_com',
-            'elecload_non_heat_com',
-            'hydrogenload_non_heat_eh',
-            'oil_non_heat_eh',
-            'solid_fuel_non_heat_eh',
-            # optimised mode only
-            'heatload_res',
-            'heatload_com',
-            # constrained mode only
-            'building_biomass_boiler',
-            'building_elec_boiler',
-            'building_heatpump',
-            'building_gas_boiler',
-            'building_hydrogen_boiler',
-            'building_oil_boiler',
-            'building_solidfuel_boiler',
-            'dh_biomass_boiler',
-            'dh_elec_boiler',
-            'dh_gas_CHP',
-            'dh_hydrogen_fuelcell',
-            #weather_data
-            'wind_speed_eh',
-            'wind_speed_bus',
-            'insolation_eh',
-            'insolation_bus',
-            #transport
-            'elec_trans',
-            'hydrogen_trans',
-        ]
-        for input_ in inputs_with_region_and_interval:
+        for param_name in INPUTS_ANNUAL:
+            with metrics.phase('inputs/' + param_name) as record:
+                param_data = data.get_data(param_name)
+                record['rows'] = write_input_annual(
+                    param_data, param_name, data.current_timestep, conn)
+                record['bytes'] = param_data.as_ndarray().nbytes
+
+        for input_ in INPUTS_TIMESTEP:
             if input_ in self.inputs:
-                self._load_input_2d(data, input_)
+                with metrics.phase('inputs/' + input_) as record:
+                    record['rows'], record['bytes'] = self._load_input_2d(data, input_, conn)
 
-    def _load_input_2d(self, data_handle, name):
+    def _load_input_2d(self, data_handle, name, conn):
+        """Write a (region, interval) input to the database
+
+        Returns
+        -------
+        tuple
+            ``(rows, bytes)`` written
+        """
         data = data_handle.get_data(name)
         self.logger.debug("Input %s: %s", name, data)
 
         region_names, interval_names = self.get_dim_names(data.spec)
 
         self.logger.debug("Writing %s to database", name)
-        write_input_timestep(
-            data, name, data_handle.current_timestep, region_names, interval_names)
+        rows = write_input_timestep(
+            data, name, data_handle.current_timestep, region_names, interval_names, conn)
+        return rows, data.as_ndarray().nbytes
 
     def run_the_model(self):
         """Run the model
@@ -241,36 +398,74 @@ class EnergySupplyWrapper(SectorModel):
 
         os.environ["ES_PATH"] = str(model_dir)
         self.logger.debug("\n\n***Running the Energy Supply Model***\n\n")
-        self.logger.debug(check_output(['mosel', 'exec', model_path]))
 
-    def retrieve_outputs(self, data, now):
+        env = dict(os.environ)
+        if self._schema is not None:
+            # The model connects through ODBC, which passes PGOPTIONS on to libpq
+            env['PGOPTIONS'] = '-c search_path={},public'.format(self._schema)
+
+        if self._persistent_solver:
+            if self._solver is None:
+                self._solver = MoselWorker(
+                    model_path, self.logger, self._solver_timeout, env=env)
+                atexit.register(self._solver.close)
+            self._solver.solve()
+        else:
+            arguments = ['mosel', 'exec', model_path]
+            process = Popen(
+                arguments, stdout=PIPE, stderr=STDOUT, universal_newlines=True, env=env)
+            for line in process.stdout:
+                self.logger.debug(line.rstrip())
+            if process.wait() != 0:
+                raise CalledProcessError(process.returncode, arguments)
+
+    def retrieve_outputs(self, data, now, conn, metrics=None):
         """Retrieves results from the model
+
+        All outputs for the timestep are read in a single query. If outputs are
+        exported, every timestep and annual result for the year is also written to
+        Parquet files under the model run results, which ``read_output_file`` reads back
+        without going through the database.
         """
-        # Open database connection
-        conn = establish_connection()
+        if metrics is None:
+            metrics = TimestepMetrics(now)
+
+        output_dims = {
+            name: self.get_dim_names(spec) for name, spec in self.outputs.items()
+        }
+        with metrics.phase('outputs') as record:
+            if self._export_outputs:
+                # Read every parameter, export them all, then arrange the smif outputs
+                columns = get_timestep_columns(conn, now)
+                results = outputs_from_columns(columns, output_dims)
+            else:
+                results = get_timestep_outputs(conn, output_dims, now)
+            record['rows'] = sum(output.size for output in results.values())
+            record['bytes'] = sum(output.nbytes for output in results.values())
+
+        if self._export_outputs:
+            with metrics.phase('export_outputs') as record:
+                filename = self._results_path(
+                    data, 'outputs', 'output_timestep_{}.parquet'.format(now))
+                write_output_file(
+                    columns, filename, ['region', 'interval', 'value'])
+                annual_filename = self._results_path(
+                    data, 'outputs', 'output_annual_{}.parquet'.format(now))
+                write_output_file(
+                    get_annual_columns(conn, now), annual_filename, ['region', 'value'])
+                record['bytes'] = \
+                    os.path.getsize(filename) + os.path.getsize(annual_filename)
 
         # Write timestep results to data handler
-        for output in self.outputs:
-            self.set_results(data, conn, output)
-
-        # Close database connection
-        conn.close()
+        for name, output in results.items():
+            self.logger.info("Writing results for %s", name)
+            with metrics.phase('outputs/' + name) as record:
+                data.set_results(name, output)
+                record['rows'] = output.size
+                record['bytes'] = output.nbytes
 
         self.logger.debug("Energy supplyWrapper produced outputs in %s", now)
 
-    def set_results(self, data_handle, conn, name):
-        """Pass results from database to data handle
-        """
-        self.logger.info("Writing results for %s", name)
-        spec = self.outputs[name]
-        region_names, interval_names = self.get_dim_names(spec)
-
-        output = get_timestep_output(
-            conn, name, data_handle.current_timestep, region_names, interval_names)
-
-        # set on smif DataHandle
-        data_handle.set_results(name, output)
-
     def get_dim_names(self, spec):
         """Get region and interval names for a given input
         """
@@ -287,36 +482,379 @@ class EnergySupplyWrapper(SectorModel):
         return region_names, interval_names
 
 
-def establish_connection():
-    """Connect to an existing database
+class MoselWorker(object):
+    """A long-lived Mosel console which keeps the energy supply model loaded
+
+    The model is compiled and loaded once, when the worker starts. Each call to
+    ``solve`` runs the loaded model again in the same process, which avoids process
+    start-up, licence checkout and model compilation on every timestep. Solver
+    output is passed to the logger line by line as it arrives.
+
+    Arguments
+    ---------
+    model_path : str
+        Path to ``Energy_Supply_Master.mos``
+    logger : logging.Logger
+    timeout : float, default=None
+        Seconds to wait for the next line of solver output before giving up
+    env : dict, default=None
+        Environment for the Mosel process
+    """
+    returned_value = re.compile(r'Returned value:\s*(-?\d+)')
+    mosel_error = re.compile(r'Mosel: E-\d+')
+
+    def __init__(self, model_path, logger, timeout=None, env=None):
+        self.model_path = model_path
+        self.logger = logger
+        self.timeout = timeout
+        self.env = env
+        self._process = None
+        self._lines = None
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Start the Mosel console and compile and load the model
+        """
+        self._process = Popen(
+            ['mosel'], stdin=PIPE, stdout=PIPE, stderr=STDOUT, universal_newlines=True,
+            bufsize=1, env=self.env)
+        self._lines = queue.Queue()
+        reader = threading.Thread(
+            target=self._read_output, args=(self._process.stdout, self._lines), daemon=True)
+        reader.start()
+        self._send('cload "{}"'.format(self.model_path))
+
+    def solve(self):
+        """Run the loaded model once and wait for it to finish
+
+        Raises
+        ------
+        RuntimeError
+            If Mosel reports an error, exits, returns a non-zero value or produces no
+            output within the timeout
+        """
+        if not self.running:
+            self.start()
+        self._send('run')
+
+        while True:
+            try:
+                line = self._lines.get(timeout=self.timeout)
+            except queue.Empty:
+                self.close()
+                raise RuntimeError(
+                    "Energy supply model produced no output for {}s".format(self.timeout))
+            if line is None:
+                self.close()
+                raise RuntimeError("Mosel exited while running the energy supply model")
+
+            self.logger.debug(line)
+            if self.mosel_error.search(line):
+                self.close()
+                raise RuntimeError("Mosel failed to run the energy supply model: " + line)
+            match = self.returned_value.search(line)
+            if match:
+                if int(match.group(1)) != 0:
+                    raise RuntimeError(
+                        "Energy supply model returned {}".format(match.group(1)))
+                return
+
+    def close(self):
+        """Stop the Mosel console, if it is running
+        """
+        if self.running:
+            try:
+                self._send('quit')
+                self._process.wait(timeout=10)
+            except (OSError, TimeoutExpired):
+                self._process.kill()
+        self._process = None
+
+    def _send(self, command):
+        self._process.stdin.write(command + '\n')
+        self._process.stdin.flush()
+
+    @staticmethod
+    def _read_output(stream, lines):
+        for line in stream:
+            lines.put(line.rstrip())
+        lines.put(None)
+
+
+class TimestepMetrics(object):
+    """Wall time, row counts and bytes for each phase of a timestep
+
+    Example
+    -------
+    ::
+
+        metrics = TimestepMetrics(2015)
+        with metrics.phase('inputs/elecload') as record:
+            record['rows'] = write_input_timestep(...)
+        metrics.write('timestep_2015.json')
+
+    Arguments
+    ---------
+    timestep : int
+    """
+    def __init__(self, timestep):
+        self.timestep = timestep
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block of work, which may fill in ``rows`` and ``bytes`` on the record
+        """
+        record = {'phase': name, 'seconds': None, 'rows': None, 'bytes': None}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.phases.append(record)
+
+    def seconds(self, name=None):
+        """Total wall time of all phases, or of the phases with a given name
+        """
+        return sum(
+            record['seconds'] for record in self.phases
+            if name is None or record['phase'] == name)
+
+    def write(self, filename):
+        """Write the phase records to a JSON file
+        """
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as fh:
+            json.dump({'timestep': self.timestep, 'phases': self.phases}, fh, indent=2)
+
+
+# Connections kept open per process - each parallel model run holds at most this many
+# connections against the database ``max_connections``
+MAX_POOLED_CONNECTIONS = 2
+
+_CONNECTION_POOL = None
+
+
+@lru_cache(maxsize=None)
+def read_dbconfig():
+    """Read the database connection settings, once per process
+
+    Returns
+    -------
+    dict
+        Keyword arguments for ``psycopg2.connect``
     """
     config = ConfigParser()
     config.read(
         os.path.join(os.path.dirname(__file__), '..', '..', 'provision', 'dbconfig.ini'))
-    dbconfig = config['energy-supply']
-    conn = psycopg2.connect(**dbconfig)
+    return dict(config['energy-supply'])
+
+
+def establish_connection():
+    """Connect to an existing database
+    """
+    conn = psycopg2.connect(**read_dbconfig())
     return conn
 
 
-def clear_results(year):
-    conn = establish_connection()
-    # Open a cursor to perform database operations
-    cur = conn.cursor()
+def get_connection_pool():
+    """Return the process-wide connection pool, creating it on first use
+    """
+    global _CONNECTION_POOL
+    if _CONNECTION_POOL is None or _CONNECTION_POOL.closed:
+        _CONNECTION_POOL = psycopg2.pool.ThreadedConnectionPool(
+            1, MAX_POOLED_CONNECTIONS, **read_dbconfig())
+    return _CONNECTION_POOL
 
-    sql = """DELETE FROM "output_timestep" WHERE year=%s;"""
 
-    cur.execute(sql, (year,))
+@contextmanager
+def database_session(schema=None):
+    """Borrow a pooled connection and run a single transaction on it
 
-    sql = """DELETE FROM "output_annual" WHERE year=%s;"""
+    The transaction is committed if the block completes and rolled back if it
+    raises. The connection is returned to the pool either way.
 
-    cur.execute(sql, (year,))
+    Arguments
+    ---------
+    schema : str, default=None
+        If given, unqualified table names resolve to this schema first, then to
+        ``public``, for the duration of the transaction
 
-    # Make the changes to the database persistent
-    conn.commit()
+    Example
+    -------
+    ::
 
-    # Close communication with the database
-    cur.close()
-    conn.close()
+        with database_session() as conn:
+            clear_results(year, conn)
+            write_simduration(year, conn)
+    """
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    try:
+        if schema is not None:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("SET LOCAL search_path TO {}, public").format(
+                    sql.Identifier(schema)))
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+@contextmanager
+def savepoint(conn, name):
+    """Run a block of writes inside a named savepoint
+
+    On error the writes made in the block are rolled back to the savepoint and the
+    original error is re-raised, so the enclosing transaction can be abandoned cleanly.
+
+    Arguments
+    ---------
+    conn : psycopg2.extensions.connection
+    name : str
+        Name of the savepoint
+    """
+    with conn.cursor() as cur:
+        cur.execute('SAVEPOINT "{}";'.format(name))
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            with conn.cursor() as cur:
+                cur.execute('ROLLBACK TO SAVEPOINT "{}";'.format(name))
+        raise
+    else:
+        with conn.cursor() as cur:
+            cur.execute('RELEASE SAVEPOINT "{}";'.format(name))
+
+
+# Tables holding model results, which are not copied into a new model run schema
+RESULT_TABLES = ['output_timestep', 'output_annual']
+
+# Tables which the wrapper clears and rewrites in full every timestep
+REWRITTEN_TABLES = [
+    'SimDuration',
+    'LoadShedCosts',
+    'GeneratorData',
+    'WindPVData_EH',
+    'WindPVData_Tran',
+    'GasStorage',
+    'GasTerminal',
+    'PipeData',
+    'LineData',
+    'HeatTechData',
+] + RESULT_TABLES
+
+# Tables holding input parameters, which the wrapper rewrites a parameter at a time
+INPUT_TABLES = ['input_timestep', 'input_annual']
+
+
+def model_run_schema(model_run_name):
+    """Return the name of the database schema for a model run
+
+    Arguments
+    ---------
+    model_run_name : str
+
+    Returns
+    -------
+    str
+        A lower case identifier of at most 63 characters, the Postgres limit. The
+        model run name is shortened to be readable, and followed by a hash of the
+        full name, so that different model runs have different schemas.
+    """
+    name = re.sub(r'[^a-z0-9_]+', '_', os.path.basename(model_run_name).lower())
+    digest = hashlib.sha256(model_run_name.encode('utf-8')).hexdigest()[:8]
+    return 'es_{}_{}'.format(name[:63 - len('es__') - len(digest)], digest)
+
+
+def create_schema(schema, conn, parameters=()):
+    """Create a schema holding a copy of every table and view in the public schema
+
+    Table definitions and data are copied, except for the contents of
+    ``REWRITTEN_TABLES`` and the rows of ``INPUT_TABLES`` for `parameters`, which the
+    wrapper writes before they are read. Views are created again in the schema, so
+    that they read from its tables. Does nothing if the schema already exists.
+
+    Arguments
+    ---------
+    schema : str
+    conn : psycopg2.extensions.connection
+    parameters : list, default=()
+        Names of the input parameters the wrapper writes
+
+    Returns
+    -------
+    bool
+        True if the schema was created
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM information_schema.schemata WHERE schema_name = %s;", (schema, ))
+        if cur.fetchone() is not None:
+            return False
+
+        cur.execute(sql.SQL("CREATE SCHEMA {};").format(sql.Identifier(schema)))
+        cur.execute("""SELECT table_name FROM information_schema.tables
+                       WHERE table_schema = 'public' AND table_type = 'BASE TABLE';""")
+        for (table_name, ) in cur.fetchall():
+            source = sql.Identifier('public', table_name)
+            target = sql.Identifier(schema, table_name)
+            cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING ALL);").format(
+                target, source))
+            if table_name in INPUT_TABLES:
+                cur.execute(
+                    sql.SQL("INSERT INTO {} SELECT * FROM {} WHERE parameter <> ALL(%s);").format(
+                        target, source),
+                    (list(parameters), ))
+            elif table_name not in REWRITTEN_TABLES:
+                cur.execute(sql.SQL("INSERT INTO {} SELECT * FROM {};").format(
+                    target, source))
+
+        # View definitions name tables without the schema while public is on the
+        # search path, so they resolve to the copies with the schema first
+        cur.execute("""SELECT c.relname, pg_get_viewdef(c.oid)
+                       FROM pg_class AS c
+                       INNER JOIN pg_namespace AS n ON c.relnamespace = n.oid
+                       WHERE n.nspname = 'public' AND c.relkind = 'v'
+                       ORDER BY c.oid;""")
+        views = cur.fetchall()
+        if views:
+            cur.execute("SELECT current_setting('search_path');")
+            (search_path, ) = cur.fetchone()
+            cur.execute(sql.SQL("SET LOCAL search_path TO {}, public;").format(
+                sql.Identifier(schema)))
+            for view_name, definition in views:
+                cur.execute(sql.SQL("CREATE VIEW {} AS ").format(
+                    sql.Identifier(schema, view_name)).as_string(cur) + definition)
+            cur.execute("SELECT set_config('search_path', %s, true);", (search_path, ))
+    return True
+
+
+def clear_results(year, conn):
+    """Remove results for `year` from the output tables
+
+    Returns
+    -------
+    int
+        The number of rows removed
+    """
+    with conn.cursor() as cur:
+        sql = """DELETE FROM "output_timestep" WHERE year=%s;"""
+        cur.execute(sql, (year,))
+        removed = cur.rowcount
+
+        sql = """DELETE FROM "output_annual" WHERE year=%s;"""
+        cur.execute(sql, (year,))
+        removed += cur.rowcount
+    return removed
 
 
 def parse_season_day_period(time_id):
@@ -356,30 +894,21 @@ def compute_interval_id(season, day, period):
     return 1 + (168 * (season - 1)) + (24 * (day - 1)) + (period - 1)
 
 
-def write_simduration(year):
-    """
+def write_simduration(year, conn):
     """
-    conn = establish_connection()
-    # Open a cursor to perform database operations
-    cur = conn.cursor()
-    cur.execute("""DELETE FROM "SimDuration";""")
-
-    sql = """
-    INSERT INTO "SimDuration" ("TimeStep", "Year", "Seasons", "Days", "Periods")
-    VALUES (%s, %s, %s, %s, %s)
     """
+    with conn.cursor() as cur:
+        cur.execute("""DELETE FROM "SimDuration";""")
 
-    cur.execute(sql, ('1', year, '4', '7', '24'))
-
-    # Make the changes to the database persistent
-    conn.commit()
+        sql = """
+        INSERT INTO "SimDuration" ("TimeStep", "Year", "Seasons", "Days", "Periods")
+        VALUES (%s, %s, %s, %s, %s)
+        """
 
-    # Close communication with the database
-    cur.close()
-    conn.close()
+        cur.execute(sql, ('1', year, '4', '7', '24'))
 
 
-def write_prices(data_array, year):
+def write_prices(data_array, year, conn):
     """Write fuel price data
 
     Arguments
@@ -388,7 +917,6 @@ def write_prices(data_array, year):
        Price data
     """
     # Open a cursor to perform database operations
-    conn = establish_connection()
     cur = conn.cursor()
     cur.execute('DELETE FROM "FuelData" WHERE "Year"=%s;', (year, ))
 
@@ -423,18 +951,20 @@ def write_prices(data_array, year):
             )
         )
 
-    # Make the changes to the database persistent and close
-    conn.commit()
     cur.close()
-    conn.close()
+    return len(dataframe)
 
 
-def write_rows_into_array(list_of_row_tuples, regions, intervals):
-    """Writes query results into a numpy array
+def write_columns_into_array(region_ids, interval_ids, values, regions, intervals):
+    """Scatters columns of query results into a numpy array
 
     Arguments
     ---------
-    list_of_row_tuples : list
+    region_ids : list
+        One-based region index of each value
+    interval_ids : list
+        One-based interval index of each value
+    values : list
 
     Returns
     -------
@@ -444,58 +974,208 @@ def write_rows_into_array(list_of_row_tuples, regions, intervals):
     num_regions = len(regions)
     num_intervals = len(intervals)
     array = np.zeros((num_regions, num_intervals))
-    for region, interval, value in list_of_row_tuples:
-        if region - 1 >= num_regions:
-            raise KeyError("Region %s out of bounds" % region)
-        if interval - 1 >= num_intervals:
-            raise KeyError("Interval %s out of bounds" % interval)
-        array[region - 1, interval - 1] = value
+
+    region_index = np.asarray(region_ids, dtype=int) - 1
+    interval_index = np.asarray(interval_ids, dtype=int) - 1
+    out_of_bounds = region_index >= num_regions
+    if out_of_bounds.any():
+        raise KeyError("Region %s out of bounds" % region_ids[np.argmax(out_of_bounds)])
+    out_of_bounds = interval_index >= num_intervals
+    if out_of_bounds.any():
+        raise KeyError("Interval %s out of bounds" % interval_ids[np.argmax(out_of_bounds)])
+
+    array[region_index, interval_index] = values
     return array
 
 
-def get_annual_output(conn, output_parameter, year, regions, intervals):
-    """Retrieves annual parameters from the database
+def get_timestep_outputs(conn, output_dims, year):
+    """Retrieves several parameters with intervals from the database in one query
+
+    Arguments
+    ---------
+    conn : psycopg2.extensions.connection
+    output_dims : dict
+        Maps output parameter name to a tuple of ``(region_names, interval_names)``
+    year : int
+
+    Returns
+    -------
+    dict
+        Maps output parameter name to a (region, interval) numpy.ndarray, filled with
+        zeros where the model wrote no value
     """
-    with conn.cursor() as cur:
-        sql = """SELECT r.name AS region, '1', o.value AS value
-                 FROM "output_annual" AS o
-                 INNER JOIN region AS r ON o.region_id = r.id
-                 WHERE parameter = %s AND year = %s;"""
-        cur.execute(sql, (output_parameter, year))
-        try:
-            results = write_rows_into_array(cur, regions, intervals)
-        except(KeyError) as ex:
-            raise KeyError(str(ex) + " in parameter %s" % output_parameter) from ex
-    return results
+    columns = get_timestep_columns(conn, year, list(output_dims))
+    return outputs_from_columns(columns, output_dims)
+
+
+def get_timestep_columns(conn, year, parameters=None):
+    """Read timestep results for a year as columns of values for each parameter
 
+    Rows are aggregated into one array per parameter on the server, so each parameter
+    comes back as a few columns rather than one Python tuple per row.
 
-def get_timestep_output(conn, output_parameter, year, regions, intervals):
-    """Retrieves parameters with intervals from the database
+    Arguments
+    ---------
+    conn : psycopg2.extensions.connection
+    year : int
+    parameters : list, default=None
+        Names of the parameters to read, or all parameters if None
+
+    Returns
+    -------
+    dict
+        Maps parameter name to a tuple of numpy.ndarray columns
+        ``(region_names, interval_ids, values)``
     """
-    # Open a cursor to perform database operations
+    where = "year = %s"
+    args = [year]
+    if parameters is not None:
+        where += " AND parameter = ANY(%s)"
+        args.append(list(parameters))
+
+    columns = {}
     with conn.cursor() as cur:
-        sql = """SELECT o.season, o.day, o.period,
-                 r.name AS region, o.value AS value
+        sql = """SELECT o.parameter,
+                 array_agg(r.name) AS regions,
+                 array_agg(1 + 168 * (o.season - 1) + 24 * (o.day - 1) + (o.period - 1))
+                    AS intervals,
+                 array_agg(o.value) AS value
                  FROM "output_timestep" AS o
                  INNER JOIN region AS r ON o.region_id = r.id
-                 WHERE parameter = %s AND year = %s;"""
-        cur.execute(sql, (output_parameter, year))
-        region_interval_value_generator = (
-            (
-                row[3],  # region id
-                compute_interval_id(int(row[0]), int(row[1]), int(row[2])),  # interval id
-                row[4]  # value
-            )
-            for row in cur
-        )
+                 WHERE {}
+                 GROUP BY o.parameter;""".format(where)
+        cur.execute(sql, args)
+        for name, region_ids, interval_ids, values in cur:
+            columns[name] = (
+                np.array(region_ids), np.array(interval_ids, dtype=int),
+                np.array(values, dtype=float))
+    return columns
+
+
+def outputs_from_columns(columns, output_dims):
+    """Arrange columns of timestep results into (region, interval) arrays
+
+    Arguments
+    ---------
+    columns : dict
+        As returned by ``get_timestep_columns`` or ``read_output_file``
+    output_dims : dict
+        Maps output parameter name to a tuple of ``(region_names, interval_names)``
+
+    Returns
+    -------
+    dict
+        Maps output parameter name to a (region, interval) numpy.ndarray, filled with
+        zeros where the model wrote no value
+    """
+    results = {}
+    for name, (regions, intervals) in output_dims.items():
+        if name not in columns:
+            results[name] = np.zeros((len(regions), len(intervals)))
+            continue
+        region_ids, interval_ids, values = columns[name]
         try:
-            results = write_rows_into_array(
-                region_interval_value_generator, regions, intervals)
+            results[name] = write_columns_into_array(
+                region_ids, interval_ids, values, regions, intervals)
         except(KeyError) as ex:
-            raise KeyError(str(ex) + " in parameter %s" % output_parameter) from ex
+            raise KeyError(str(ex) + " in parameter %s" % name) from ex
     return results
 
 
+def get_annual_columns(conn, year):
+    """Read annual results for a year as columns of values for each parameter
+
+    Returns
+    -------
+    dict
+        Maps parameter name to a tuple of numpy.ndarray columns ``(region_names, values)``
+    """
+    columns = {}
+    with conn.cursor() as cur:
+        cur.execute("""SELECT o.parameter, array_agg(r.name), array_agg(o.value)
+                       FROM "output_annual" AS o
+                       INNER JOIN region AS r ON o.region_id = r.id
+                       WHERE year = %s
+                       GROUP BY o.parameter;""", (year, ))
+        for name, region_ids, values in cur:
+            columns[name] = (np.array(region_ids), np.array(values, dtype=float))
+    return columns
+
+
+def write_output_file(columns, filename, column_names):
+    """Write columns of results for each parameter to a compressed Parquet file
+
+    The file has a dictionary-encoded ``parameter`` column followed by
+    `column_names`, one row per result value.
+
+    Arguments
+    ---------
+    columns : dict
+        Maps parameter name to a tuple of numpy.ndarray columns
+    filename : str
+    column_names : list
+        Names of the columns in each tuple
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to export energy supply outputs")
+
+    names = sorted(columns)
+    lengths = [len(columns[name][0]) for name in names]
+    parameter = pa.DictionaryArray.from_arrays(
+        pa.array(np.repeat(np.arange(len(names), dtype=np.int32), lengths)),
+        pa.array(names, type=pa.string()))
+    arrays = [parameter]
+    for i, column_name in enumerate(column_names):
+        if names:
+            arrays.append(pa.array(np.concatenate([columns[name][i] for name in names])))
+        else:
+            arrays.append(pa.array([], type=pa.float64()))
+    table = pa.Table.from_arrays(arrays, names=['parameter'] + list(column_names))
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    pq.write_table(table, filename, compression='zstd')
+
+
+def read_output_file(filename, parameters=None):
+    """Read columns of results for each parameter from a file written by
+    ``write_output_file``
+
+    Arguments
+    ---------
+    filename : str
+    parameters : list, default=None
+        Names of the parameters to read, or all parameters if None
+
+    Returns
+    -------
+    dict
+        Maps parameter name to a tuple of numpy.ndarray columns, in file order
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to read energy supply outputs")
+
+    filters = None if parameters is None else [('parameter', 'in', list(parameters))]
+    table = pq.read_table(filename, filters=filters)
+
+    parts = {}
+    for batch in table.to_batches():
+        parameter = batch.column(0)
+        codes = parameter.indices.to_numpy(zero_copy_only=False)
+        data = [
+            batch.column(i).to_numpy(zero_copy_only=False)
+            for i in range(1, batch.num_columns)
+        ]
+        for code, name in enumerate(parameter.dictionary.to_pylist()):
+            rows = codes == code
+            if rows.any():
+                parts.setdefault(name, []).append([column[rows] for column in data])
+
+    return {
+        name: tuple(np.concatenate(column) for column in zip(*chunks))
+        for name, chunks in parts.items()
+    }
+
+
 def write_load_shed_costs(loadshedcost_elec, loadshedcost_gas, conn):
     """Write load shed cost parameters
     """
@@ -548,333 +1228,339 @@ def write_flags(heat_mode,operation_mode,heat_supply_strategy,sensitivity_mode,e
             'INSERT INTO input_flags (parameter, value) VALUES (%s, %s);',
             ('interconnector_neutral', interconnector_neutral))
 
-def retire_generator(plants):
-    conn = establish_connection()
-    cur = conn.cursor()
-
-    for plant in plants:
-
-        sql = """DELETE FROM "GeneratorData" WHERE "GeneratorName"=%s"""
+# Generator type codes used in the GeneratorData table
+GENERATOR_TYPES = {
+    'ccgt': 1,
+    'coal': 2,
+    'nuclear': 4,
+    'hydro': 5,
+    'oil': 6,
+    'ocgt (flexible generation)': 7,
+    'gas ccs' : 8,
+    'becss' : 9,
+    'biomass': 10,
+    'interconnector': 11,
+    'chp gas': 13,
+    'pumped_storage': 15,
+    'gas fired generation of ehs': 20,
+    'efw chp of ehs ': 21,
+    'biomass chp of ehs ': 22,
+    'h2 fuel cell ': 30,
+    'wind onshore' : 3,
+    'wind offshore': 12,
+    'pv'         : 23 ,
+    'dummygenerator': 100
+}
+
+
+def check_interventions(interventions, expected_keys):
+    """Check that every intervention has the expected keys
+
+    All interventions are checked before raising, so a single error lists every
+    invalid intervention.
+
+    Raises
+    ------
+    ValueError
+        If any intervention is missing any expected key
+    """
+    errors = []
+    for intervention in interventions:
+        missing = [key for key in expected_keys if key not in intervention.keys()]
+        if missing:
+            errors.append("Keys {} missing for {}".format(missing, intervention['name']))
+    if errors:
+        raise ValueError("\n".join(errors))
 
-        cur.execute(sql, (str(plant['name']), ))
 
-        # Make the changes to the database persistent
-        conn.commit()
+def extract_value(intervention, field_name):
+    """Return a float from a plain or ``{'value': ...}`` intervention field
+    """
+    if isinstance(intervention[field_name], dict):
+        value = float(intervention[field_name]['value'])
+    else:
+        value = float(intervention[field_name])
+    return value
 
-    # Close communication with the database
-    cur.close()
-    conn.close()
 
+def insert_rows(table_name, rows, conn):
+    """Bulk insert rows into a table
 
-def build_generator(plants, current_timestep):
-    """Writes an intervention into the GeneratorData table
+    Rows are grouped by the set of columns they provide and each group is written
+    with a single multi-row ``INSERT``.
 
     Arguments
     ---------
-    plants : list
+    table_name : str
+    rows : list
+        A list of dicts mapping column name to value
+    conn : psycopg2.extensions.connection
+
+    Returns
+    -------
+    int
+        The number of rows written
     """
-    conn = establish_connection()
-    cur = conn.cursor()
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row.keys()), []).append(tuple(row.values()))
 
-    expected_keys = ['type', 'name', 'location', 'min_power', 'capacity',
-                     'build_year', 'technical_lifetime', 'sys_layer']
+    with conn.cursor() as cur:
+        for columns, values in groups.items():
+            sql = 'INSERT INTO "{}" ({}) VALUES %s'.format(
+                table_name, ', '.join('"{}"'.format(column) for column in columns))
+            try:
+                psycopg2.extras.execute_values(cur, sql, values, page_size=len(values))
+            except psycopg2.DataError as ex:
+                raise psycopg2.DataError(
+                    "Failed to write {} rows to {}: {}".format(len(values), table_name, ex)
+                ) from ex
+    return len(rows)
 
-    for plant in plants:
 
-        missing = []
-        valid = True
-        for key in expected_keys:
-            if key not in plant.keys():
-                missing.append(key)
-                valid = False
-
-        if not valid:
-            raise ValueError("Keys {} missing for {}".format(
-                             missing,
-                             plant['name'])
-            )
-        try:
-            plant['type'] = int(plant['type'])
-        except TypeError:
-            pass
+def replace_rows(table_name, rows, conn):
+    """Replace the contents of a table with `rows`
 
-        if isinstance(plant['type'], str):
-            plant_type = {'ccgt': 1,
-                          'coal': 2,
-                          'nuclear': 4,
-                          'hydro': 5,
-                          'oil': 6,
-                          'ocgt (flexible generation)': 7,
-                          'gas ccs' : 8,
-                          'becss' : 9,
-                          'biomass': 10,
-                          'interconnector': 11,
-                          'chp gas': 13,
-                          'pumped_storage': 15,
-                          'gas fired generation of ehs': 20,
-                          'efw chp of ehs ': 21,
-                          'biomass chp of ehs ': 22,
-                          'h2 fuel cell ': 30,
-                          'wind onshore' : 3,
-                          'wind offshore': 12,
-                          'pv'         : 23 ,
-                          'dummygenerator': 100}[plant['type'].lower()]
-        elif isinstance(plant['type'], int):
-            plant_type = plant['type']
-        else:
-            raise ValueError("'type' field '{}' is incorrect".format(
-                plant['type']))
+    Deleting before inserting makes writing the same interventions twice in one
+    transaction leave the same table state as writing them once.
+    """
+    delete_from(table_name, conn)
+    return insert_rows(table_name, rows, conn)
 
-        def extract_value(generator, field_name):
-            if isinstance(generator[field_name], dict):
-                value = float(generator[field_name]['value'])
-            else:
-                value = float(generator[field_name])
-            return value
 
-        min_power = extract_value(plant, 'min_power')
-        capacity = extract_value(plant, 'capacity')
-        lifetime = extract_value(plant, 'technical_lifetime')
+# Column numbering the rows of each intervention table by position, if any
+INTERVENTION_NUMBER_COLUMNS = {
+    "GeneratorData": None,
+    "GasStorage": "StorageNum",
+    "GasTerminal": "TerminalNum",
+    "PipeData": "PipeNum",
+    "HeatTechData": "HeatNum",
+    "LineData": "LineNum",
+}
 
-        if int(plant['sys_layer']) == 2:
 
-            sql = """
-            INSERT INTO "GeneratorData" ("Type", "GeneratorName", "EH_Conn_Num","MinPower",
-                "MaxPower", "Year", "Retire", "SysLayer")
-            VALUES ( %s, %s, %s, %s, %s, %s, %s, %s)"""
-            data = (plant_type,
-                    plant['name'],
-                    plant['location'],
-                    min_power,
-                    capacity,
-                    current_timestep,
-                    float(plant['build_year']) + lifetime,
-                    plant['sys_layer']
-                    )
-
-        elif plant_type == 1:
-
-            sql = """
-                INSERT INTO "GeneratorData" ("Type", "GeneratorName", "GasNode", "BusNum",
-                    "MinPower", "MaxPower", "Year", "Retire", "SysLayer")
-                VALUES ( %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-            data = (plant_type,
-                    plant['name'],
-                    plant['to_location'],
-                    plant['location'],
-                    min_power,
-                    capacity,
-                    current_timestep,
-                    float(plant['build_year']) + lifetime,
-                    plant['sys_layer']
-                    )
-
-        elif plant_type == 8:
-
-            sql = """
-                INSERT INTO "GeneratorData" ("Type", "GeneratorName", "GasNode", "BusNum",
-                    "MinPower", "MaxPower", "Year", "Retire", "SysLayer")
-                VALUES ( %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-            data = (plant_type,
-                    plant['name'],
-                    plant['to_location'],
-                    plant['location'],
-                    min_power,
-                    capacity,
-                    current_timestep,
-                    float(plant['build_year']) + lifetime,
-                    plant['sys_layer']
-                    )
-
-        elif plant_type == 11:
-
-            sql = """
-                INSERT INTO "GeneratorData" ("Type", "GeneratorName", "BusNum",
-                    "MinPower", "MaxPower", "Year", "Retire", "SysLayer","Inter_conn")
-                VALUES ( %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-            data = (plant_type,
-                    plant['name'],
-                    plant['location'],
-                    min_power,
-                    capacity,
-                    current_timestep,
-                    float(plant['build_year']) + lifetime,
-                    plant['sys_layer'],
-                    plant['to_location']
-                    )
-
-        elif plant_type == 15:
-
-            sql = """
-                INSERT INTO "GeneratorData" ("Type", "GeneratorName", "BusNum",
-                    "MinPower", "MaxPower", "PumpStorageCapacity", "Year", "Retire", "SysLayer")
-                VALUES ( %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-            data = (plant_type,
-                    plant['name'],
-                    plant['location'],
-                    min_power,
-                    capacity,
-                    extract_value(plant, 'pumpstore_capacity'),
-                    current_timestep,
-                    float(plant['build_year']) + lifetime,
-                    plant['sys_layer']
-                    )
+def get_row_columns(table_name, cur):
+    """Return the columns which identify an intervention row, in table order
 
-        else:
+    These are all the columns the wrapper writes except "Year" and the number
+    column, each with whether the column is numeric.
+    """
+    cur.execute(
+        """SELECT a.attname, t.typcategory = 'N'
+           FROM pg_attribute AS a
+           INNER JOIN pg_type AS t ON a.atttypid = t.oid
+           WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+           AND NOT a.atthasdef
+           ORDER BY a.attnum;""",
+        (sql.Identifier(table_name).as_string(cur), ))
+    excluded = ("Year", INTERVENTION_NUMBER_COLUMNS[table_name])
+    return [(column, numeric) for column, numeric in cur.fetchall() if column not in excluded]
+
+
+def _row_key(row, columns):
+    """Comparable identity of a row, normalising values as the database stores them
+    """
+    key = []
+    for column, numeric in columns:
+        value = row.get(column)
+        if value is not None:
+            value = float(value) if numeric else str(value)
+        key.append(value)
+    return tuple(key)
 
-            sql = """
-            INSERT INTO "GeneratorData" ("Type", "GeneratorName",  "BusNum", "MinPower",
-                "MaxPower", "Year", "Retire", "SysLayer")
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            data = (plant_type,
-                    plant['name'],
-                    plant['location'],
-                    min_power,
-                    capacity,
-                    current_timestep,
-                    float(plant['build_year']) + lifetime,
-                    plant['sys_layer']
-                    )
-        try:
-            cur.execute(sql, data)
-        except psycopg2.DataError as ex:
-            print(sql, data)
-            raise psycopg2.DataError(ex)
-        # Make the changes to the database persistent
-        conn.commit()
 
-    # Close communication with the database
-    cur.close()
-    conn.close()
+def diff_rows(current, rows, columns, number_column=None):
+    """Compare the rows in a table with the rows it should hold
 
+    Rows are matched on the values of `columns`, so a row keeps its place in the
+    table while it is unchanged, even if it is renumbered because rows before it
+    were added or removed, or written again in a later timestep.
 
-def get_distributed_eh(location, year):
+    Arguments
+    ---------
+    current : list
+        ``(row_id, row)`` pairs for the rows now in the table, where each row is a
+        dict mapping column name to value
+    rows : list
+        The rows the table should hold, as dicts mapping column name to value
+    columns : list
+        ``(column, numeric)`` pairs, as returned by :func:`get_row_columns`
+    number_column : str, default=None
+        Column numbering the rows by position
 
-    sql =  """
-    SELECT "OnshoreWindCap", "OffshoreWindCap", "PvCapacity"
-    FROM "WindPVData_EH"
-    WHERE "EH_Conn_Num"=%s AND "Year"=%s;
+    Returns
+    -------
+    tuple
+        ``(inserts, deletes, updates)``, the rows to insert, the ids of the rows to
+        delete and ``(row_id, row)`` pairs for the matched rows whose "Year" or
+        number column differ from `row`
     """
+    unmatched = {}
+    for row_id, row in current:
+        unmatched.setdefault(_row_key(row, columns), []).append((row_id, row))
+
+    def differs(existing, row):
+        return existing.get("Year") != row.get("Year") or (
+            number_column is not None and existing[number_column] != row[number_column])
+
+    # Match rows with the same number first, so that duplicate rows are not
+    # renumbered needlessly
+    pending = []
+    updates = []
+    for row in rows:
+        candidates = unmatched.get(_row_key(row, columns))
+        for index, (row_id, existing) in enumerate(candidates or []):
+            if number_column is None or existing[number_column] == row[number_column]:
+                del candidates[index]
+                if differs(existing, row):
+                    updates.append((row_id, row))
+                break
+        else:
+            pending.append(row)
+
+    inserts = []
+    for row in pending:
+        candidates = unmatched.get(_row_key(row, columns))
+        if candidates:
+            row_id, _ = candidates.pop(0)
+            updates.append((row_id, row))
+        else:
+            inserts.append(row)
 
-    conn = establish_connection()
-    # Open a cursor to perform database operations
-    with conn.cursor() as cur:
-        cur.execute(sql, (location, year))
-        mapping = cur.fetchone()
-    conn.close()
-    return mapping
-
+    deletes = [row_id for candidates in unmatched.values() for row_id, _ in candidates]
+    return inserts, deletes, updates
 
-def get_distributed_tran(location, year):
 
-    sql =  """
-    SELECT "OnshoreWindCap", "OffshoreWindCap", "PvCapacity"
-    FROM "WindPVData_Tran"
-    WHERE "BusNum"=%s AND "Year"=%s;
-    """
+def update_rows(table_name, rows, conn):
+    """Update a table to hold `rows`, changing only the rows which differ
 
-    conn = establish_connection()
-    # Open a cursor to perform database operations
-    with conn.cursor() as cur:
-        cur.execute(sql, (location, year))
-        mapping = cur.fetchone()
-    conn.close()
-    return mapping
+    Rows already in the table which match a row in `rows` are kept in place, with
+    their "Year" and number updated. The table then holds the same rows as after
+    ``replace_rows(table_name, rows, conn)``.
 
+    Arguments
+    ---------
+    table_name : str
+        One of the tables in ``INTERVENTION_NUMBER_COLUMNS``
+    rows : list
+        The rows the table should hold, as dicts mapping column name to value
+    conn : psycopg2.extensions.connection
 
-def build_distributed(plants, current_timestep):
-    """Write a list of interventions into the WindPVData_* table
+    Returns
+    -------
+    tuple
+        Number of rows ``(inserted, deleted, updated)``
+    """
+    number_column = INTERVENTION_NUMBER_COLUMNS[table_name]
+    updated_columns = ["Year"] if number_column is None else ["Year", number_column]
+    with conn.cursor() as cur:
+        columns = get_row_columns(table_name, cur)
+        names = [column for column, _ in columns] + updated_columns
+
+        query = sql.SQL("SELECT ctid::text, {} FROM {};").format(
+            sql.SQL(', ').join(sql.Identifier(name) for name in names),
+            sql.Identifier(table_name))
+        cur.execute(query)
+        current = [(record[0], dict(zip(names, record[1:]))) for record in cur.fetchall()]
+
+        inserts, deletes, updates = diff_rows(current, rows, columns, number_column)
+
+        if deletes:
+            query = sql.SQL("DELETE FROM {} WHERE ctid = ANY(%s::tid[]);").format(
+                sql.Identifier(table_name))
+            cur.execute(query, (deletes, ))
+        if updates:
+            query = sql.SQL(
+                "UPDATE {table} SET {assignments} FROM (VALUES %s) AS v(row_id, {values}) "
+                "WHERE {table}.ctid = v.row_id::tid;").format(
+                    table=sql.Identifier(table_name),
+                    assignments=sql.SQL(', ').join(
+                        sql.SQL("{} = v.{}").format(sql.Identifier(name), sql.Identifier(name))
+                        for name in updated_columns),
+                    values=sql.SQL(', ').join(sql.Identifier(name) for name in updated_columns))
+            values = [
+                (row_id, ) + tuple(row[name] for name in updated_columns)
+                for row_id, row in updates
+            ]
+            psycopg2.extras.execute_values(
+                cur, query.as_string(cur), values, page_size=len(values))
+    insert_rows(table_name, inserts, conn)
+
+    return len(inserts), len(deletes), len(updates)
+
+
+def generator_rows(plants, current_timestep):
+    """Validate generator interventions and convert them to GeneratorData rows
 
     Arguments
     ---------
     plants : list
-    """
-
-    conn = establish_connection()
-    cur = conn.cursor()
+    current_timestep : int
 
-    plant_remap = {x: {'build_year': 0,
-                       'offshore': 0,
-                       'onshore': 0,
-                       'pv': 0,
-                       'table_name': ''}
-                   for x in range(1, 30)}
+    Returns
+    -------
+    list
+        A list of dicts mapping column name to value
+    """
+    expected_keys = ['type', 'name', 'location', 'min_power', 'capacity',
+                     'build_year', 'technical_lifetime', 'sys_layer']
+    check_interventions(plants, expected_keys)
 
+    rows = []
     for plant in plants:
-        location = int(plant['location'])
-        if location in plant_remap:
-            plant_remap[location]['build_year'] = current_timestep
-            plant_remap[location]['table_name'] = plant['table_name']
-            if  plant['type'] == 'offshorewind':
-                plant_remap[location]['offshore'] += float(plant['capacity']['value'])
-            elif plant['type'] == 'onshorewind':
-                plant_remap[location]['onshore'] += float(plant['capacity']['value'])
-            elif plant['type'] == 'pv':
-                plant_remap[location]['pv'] += float(plant['capacity']['value'])
-            else:
-                raise ValueError("Cannot read type of {}".format(plant))
-
-    for index, (location, plant) in enumerate(plant_remap.items()):
-
-        if plant['table_name'] == 'WindPVData_EH':
-            sql = """
-            INSERT INTO "WindPVData_EH" ("EH_Conn_Num", "Year", "OnshoreWindCap",
-                "OffshoreWindCap", "PvCapacity")
-            VALUES (%s, %s, %s, %s, %s)
-            """
-
-        elif plant['table_name'] == 'WindPVData_Tran':
-            sql = """
-            INSERT INTO "WindPVData_Tran" ("BusNum", "Year", "OnshoreWindCap",
-                "OffshoreWindCap","PvCapacity")
-            VALUES (%s, %s, %s, %s, %s)
-            """
-        else:
-            raise ValueError("Cannot read table name of element {}: {}".format(index, plant))
-
-        data = (
-                location,
-                current_timestep,
-                plant['onshore'],
-                plant['offshore'],
-                plant['pv'])
-
-        # print("Updating location {} into table {}".format(location, plant['table_name']))
+        try:
+            plant['type'] = int(plant['type'])
+        except (TypeError, ValueError):
+            pass
 
-        cur.execute(sql, data)
+        if isinstance(plant['type'], str):
+            try:
+                plant_type = GENERATOR_TYPES[plant['type'].lower()]
+            except KeyError as ex:
+                raise ValueError("'type' field '{}' of {} is not a known generator type".format(
+                    plant['type'], plant['name'])) from ex
+        elif isinstance(plant['type'], int):
+            plant_type = plant['type']
+        else:
+            raise ValueError("'type' field '{}' is incorrect".format(
+                plant['type']))
 
-        # Make the changes to the database persistent
-        conn.commit()
+        min_power = extract_value(plant, 'min_power')
+        capacity = extract_value(plant, 'capacity')
+        lifetime = extract_value(plant, 'technical_lifetime')
 
-    # Close communication with the database
-    cur.close()
-    conn.close()
+        row = {"Type": plant_type, "GeneratorName": plant['name']}
+        if int(plant['sys_layer']) == 2:
+            row["EH_Conn_Num"] = plant['location']
+        elif plant_type in (1, 8):
+            row["GasNode"] = plant['to_location']
+            row["BusNum"] = plant['location']
+        else:
+            row["BusNum"] = plant['location']
 
+        row["MinPower"] = min_power
+        row["MaxPower"] = capacity
+        if int(plant['sys_layer']) != 2 and plant_type == 15:
+            row["PumpStorageCapacity"] = extract_value(plant, 'pumpstore_capacity')
+        row["Year"] = current_timestep
+        row["Retire"] = float(plant['build_year']) + lifetime
+        row["SysLayer"] = plant['sys_layer']
+        if int(plant['sys_layer']) != 2 and plant_type == 11:
+            row["Inter_conn"] = plant['to_location']
 
-def delete_from(table_name):
-    conn = establish_connection()
-    cur = conn.cursor()
+        rows.append(row)
 
-    sql = '''DELETE FROM "''' + table_name + '''";'''
-    cur.execute(sql)
-    # Make the changes to the database persistent
-    conn.commit()
+    return rows
 
-    # Close communication with the database
-    cur.close()
-    conn.close()
 
+def delete_from(table_name, conn):
+    with conn.cursor() as cur:
+        sql = '''DELETE FROM "''' + table_name + '''";'''
+        cur.execute(sql)
 
-def build_gas_stores(gas_stores, current_timestep):
-    """Set up the initial system from a list of interventions
 
-    Write in the all interventions with the intervention_name ``gasstore``
-    to the GasStore table.
+def gas_store_rows(gas_stores, current_timestep):
+    """Validate gas store interventions and convert them to GasStorage rows
 
     Arguments
     ---------
@@ -893,44 +1579,26 @@ def build_gas_stores(gas_stores, current_timestep):
         OutFlowCost double precision
         Syslayer integer
     """
-    conn = establish_connection()
-    cur = conn.cursor()
-
-    cur.execute("""DELETE FROM "GasStorage";""")
-
-    for store_num, store in enumerate(gas_stores):
-
-        sql = """
-        INSERT INTO "GasStorage" ("StorageNum", "region", "Name", "Year", "InFlowCap",
-            "OutFlowCap", "StorageCap", "OutFlowCost", "Syslayer")
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-
-        data = (store_num + 1,
-                store['location'],
-                store['name'],
-                current_timestep,
-                store['inflowcap'],
-                store['outflowcap'],
-                store['capacity']['value'],
-                store['outflowcost'],
-                store['syslayer']
-                )
-
-        cur.execute(sql, data)
-
-        # Make the changes to the database persistent
-        conn.commit()
-
-    # Close communication with the database
-    cur.close()
-    conn.close()
-
-
-def build_gas_terminals(gas_terminals, current_timestep):
-    """Set up the initial system from a list of interventions
-
-    Write in the all interventions to the GasTerminal table.
+    check_interventions(gas_stores, ['location', 'name', 'inflowcap', 'outflowcap',
+                                     'capacity', 'outflowcost', 'syslayer'])
+    return [
+        {
+            "StorageNum": store_num + 1,
+            "region": store['location'],
+            "Name": store['name'],
+            "Year": current_timestep,
+            "InFlowCap": store['inflowcap'],
+            "OutFlowCap": store['outflowcap'],
+            "StorageCap": store['capacity']['value'],
+            "OutFlowCost": store['outflowcost'],
+            "Syslayer": store['syslayer']
+        }
+        for store_num, store in enumerate(gas_stores)
+    ]
+
+
+def gas_terminal_rows(gas_terminals, current_timestep):
+    """Validate gas terminal interventions and convert them to GasTerminal rows
 
     Arguments
     ---------
@@ -953,47 +1621,29 @@ def build_gas_terminals(gas_terminals, current_timestep):
     InterSupp          | integer                |
 
     """
-    conn = establish_connection()
-    cur = conn.cursor()
-
-    cur.execute("""DELETE FROM "GasTerminal";""")
-
-    for terminal_num, terminal in enumerate(gas_terminals):
-
-        sql = """
-        INSERT INTO "GasTerminal" ("TerminalNum", "Year", "Name", "GasNode",
-            "GasTerminalOptCost", "TerminalCapacity", "LNGCapacity", "InterCapacity",
-            "DomCapacity","DomSupp","InterSupp")
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-
-        data = (terminal_num + 1,
-                current_timestep,
-                terminal['name'],
-                terminal['location'],
-                terminal['operational_cost']['value'],
-                terminal['capacity']['value'],
-                terminal['lngcapacity'],
-                terminal['intercapacity'],
-                terminal['domcapacity'],
-                terminal['domestic_supply_source'],
-                terminal['import_supply_source']
-                )
-
-        cur.execute(sql, data)
-
-        # Make the changes to the database persistent
-        conn.commit()
-
-    # Close communication with the database
-    cur.close()
-    conn.close()
-
-
-def build_pipes(pipes, current_timestep):
-    """Set up the initial system from a list of interventions
-
-    Write in the all pipes to the PipeData table.
+    check_interventions(gas_terminals, ['name', 'location', 'operational_cost', 'capacity',
+                                        'lngcapacity', 'intercapacity', 'domcapacity',
+                                        'domestic_supply_source', 'import_supply_source'])
+    return [
+        {
+            "TerminalNum": terminal_num + 1,
+            "Year": current_timestep,
+            "Name": terminal['name'],
+            "GasNode": terminal['location'],
+            "GasTerminalOptCost": terminal['operational_cost']['value'],
+            "TerminalCapacity": terminal['capacity']['value'],
+            "LNGCapacity": terminal['lngcapacity'],
+            "InterCapacity": terminal['intercapacity'],
+            "DomCapacity": terminal['domcapacity'],
+            "DomSupp": terminal['domestic_supply_source'],
+            "InterSupp": terminal['import_supply_source']
+        }
+        for terminal_num, terminal in enumerate(gas_terminals)
+    ]
+
+
+def pipe_rows(pipes, current_timestep):
+    """Validate pipe interventions and convert them to PipeData rows
 
     Arguments
     ---------
@@ -1015,42 +1665,26 @@ def build_pipes(pipes, current_timestep):
     MaxFlow | double precision |
 
     """
-    conn = establish_connection()
-    cur = conn.cursor()
-
-    for pipe_num, pipe in enumerate(pipes):
-
-        sql = """
-        INSERT INTO "PipeData" ("PipeNum", "FromNode", "ToNode", "Year", "Length", "Diameter",
-            "PipeEff", "MinFlow", "MaxFlow")
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-
-        data = (pipe_num + 1,
-                pipe['location'],
-                pipe['to_location'],
-                current_timestep,
-                pipe['length']['value'],
-                pipe['diameter']['value'],
-                pipe['pipeeff'],
-                pipe['minflow'],
-                pipe['maxflow']
-                )
-
-        cur.execute(sql, data)
-
-        # Make the changes to the database persistent
-        conn.commit()
-
-    # Close communication with the database
-    cur.close()
-    conn.close()
-
-
-def build_heattech(heat_techs, current_timestep):
-    """Set up system from list of interventions
-
-    Write lines into the HeatTechData table
+    check_interventions(pipes, ['location', 'to_location', 'length', 'diameter',
+                                'pipeeff', 'minflow', 'maxflow'])
+    return [
+        {
+            "PipeNum": pipe_num + 1,
+            "FromNode": pipe['location'],
+            "ToNode": pipe['to_location'],
+            "Year": current_timestep,
+            "Length": pipe['length']['value'],
+            "Diameter": pipe['diameter']['value'],
+            "PipeEff": pipe['pipeeff'],
+            "MinFlow": pipe['minflow'],
+            "MaxFlow": pipe['maxflow']
+        }
+        for pipe_num, pipe in enumerate(pipes)
+    ]
+
+
+def heattech_rows(heat_techs, current_timestep):
+    """Validate heat technology interventions and convert them to HeatTechData rows
 
     Arguments
     ---------
@@ -1069,40 +1703,23 @@ def build_heattech(heat_techs, current_timestep):
     MaxPower     | double precision      |
     Year         | integer               |
     """
-    conn = establish_connection()
-    cur = conn.cursor()
-
-    for heat_num, heat_tech in enumerate(heat_techs):
-
-        sql = """
-        INSERT INTO "HeatTechData" ("HeatNum", "Type", "HeatTechName", "EH_Conn_Num",
-            "MinPower", "MaxPower", "Year")
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-
-        data = (heat_num + 1,
-                heat_tech['type'],
-                heat_tech['name'],
-                heat_tech['location'],
-                heat_tech['minpower'],
-                heat_tech['capacity']['value'],
-                current_timestep
-                )
-
-        cur.execute(sql, data)
-
-        # Make the changes to the database persistent
-        conn.commit()
-
-    # Close communication with the database
-    cur.close()
-    conn.close()
-
-
-def build_lines(lines, current_timestep):
-    """Set up the initial system from a list of interventions
-
-    Write in the all lines to the LineData table.
+    check_interventions(heat_techs, ['type', 'name', 'location', 'minpower', 'capacity'])
+    return [
+        {
+            "HeatNum": heat_num + 1,
+            "Type": heat_tech['type'],
+            "HeatTechName": heat_tech['name'],
+            "EH_Conn_Num": heat_tech['location'],
+            "MinPower": heat_tech['minpower'],
+            "MaxPower": heat_tech['capacity']['value'],
+            "Year": current_timestep
+        }
+        for heat_num, heat_tech in enumerate(heat_techs)
+    ]
+
+
+def line_rows(lines, current_timestep):
+    """Validate line interventions and convert them to LineData rows
 
     Arguments
     ---------
@@ -1122,34 +1739,20 @@ def build_lines(lines, current_timestep):
 
 
     """
-    conn = establish_connection()
-    cur = conn.cursor()
-
-    for line_num, line in enumerate(lines):
-
-        sql = """
-        INSERT INTO "LineData" ("LineNum", "FromBus", "ToBus", "Year", "MaxCapacity")
-        VALUES (%s, %s, %s, %s, %s)
-        """
-
-        data = (line_num + 1,
-                line['location'],
-                line['to_location'],
-                current_timestep,
-                line['capacity']['value']
-                )
-
-        cur.execute(sql, data)
-
-        # Make the changes to the database persistent
-        conn.commit()
-
-    # Close communication with the database
-    cur.close()
-    conn.close()
-
-
-def get_region_mapping(input_parameter_name):
+    check_interventions(lines, ['location', 'to_location', 'capacity'])
+    return [
+        {
+            "LineNum": line_num + 1,
+            "FromBus": line['location'],
+            "ToBus": line['to_location'],
+            "Year": current_timestep,
+            "MaxCapacity": line['capacity']['value']
+        }
+        for line_num, line in enumerate(lines)
+    ]
+
+
+def get_region_mapping(input_parameter_name, conn):
     """Return a dict of database ids from region ids
 
     Arguments
@@ -1161,7 +1764,6 @@ def get_region_mapping(input_parameter_name):
     -------
     dict
     """
-    conn = establish_connection()
     # Open a cursor to perform database operations
     with conn.cursor() as cur:
         cur.execute("""SELECT name, id
@@ -1171,12 +1773,66 @@ def get_region_mapping(input_parameter_name):
                             WHERE name=%s);""",
                     (input_parameter_name, ))
         mapping = cur.fetchall()
-    conn.close()
 
     return dict(mapping)
 
 
-def write_input_timestep(input_data, parameter_name, year, region_names, interval_names):
+def copy_rows(cur, table_name, columns, values):
+    """Bulk load rows into a table through ``COPY ... FROM STDIN``
+
+    Each column is formatted as a whole into the Postgres COPY text format and the
+    rows are streamed to the server in a single round trip, which is much faster
+    than ``INSERT`` for large inputs.
+
+    Arguments
+    ---------
+    cur : psycopg2.extensions.cursor
+    table_name : str
+    columns : list
+        Names of the table columns
+    values : list
+        One entry for each column: a one-dimensional array of values, or a single
+        value which is the same in every row
+
+    Returns
+    -------
+    int
+        The number of rows written
+    """
+    lines = _copy_text(values[0])
+    for column in values[1:]:
+        lines = np.char.add(np.char.add(lines, '\t'), _copy_text(column))
+    lines = lines.reshape(-1)
+
+    buffer = io.StringIO('\n'.join(lines.tolist()) + '\n' if lines.size else '')
+    cur.copy_expert(
+        'COPY "{}" ({}) FROM STDIN;'.format(table_name, ', '.join(columns)), buffer)
+    return lines.size
+
+
+# Characters with a special meaning in the COPY text format, and their escapes
+COPY_ESCAPES = [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]
+
+
+def _copy_text(values):
+    """Format an array or single value as COPY text format fields
+
+    Floats are written with the shortest representation which reads back to the
+    same float64 value, and text is escaped.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return values.astype(np.float64).astype(str)
+    if values.dtype.kind in 'biu':
+        return values.astype(str)
+
+    text = values.astype(str)
+    for char, escaped in COPY_ESCAPES:
+        text = np.char.replace(text, char, escaped)
+    return text
+
+
+def write_input_timestep(input_data, parameter_name, year, region_names, interval_names, conn):
     """Writes input data into database table
 
     Uses the index of the numpy array as a reference to interval and region definitions
@@ -1199,7 +1855,6 @@ def write_input_timestep(input_data, parameter_name, year, region_names, interva
         region_id
         value
     """
-    conn = establish_connection()
     # Open a cursor to perform database operations
     cur = conn.cursor()
 
@@ -1207,64 +1862,52 @@ def write_input_timestep(input_data, parameter_name, year, region_names, interva
         'DELETE FROM "input_timestep" WHERE parameter=%s AND year=%s;',
         (parameter_name, year))
 
-    sql = """
-        INSERT INTO
-        input_timestep (year, season, day, period, region_id, parameter, value)
-        VALUES %s
-        """
-
-    region_mapping = get_region_mapping(parameter_name)
-
-    def values(input_data):
-        """Generate values tuples from input data
-        """
-        it = np.nditer(input_data.as_ndarray(), flags=['multi_index'])
-        while not it.finished:
-            cell = it[0]
-
-            region, interval = it.multi_index
-            season, day, period = parse_season_day_period(int(interval_names[interval]))
-            try:
-                region_id = region_mapping[int(region_names[region])]
-            except KeyError as ex:
-                msg = "Error when trying to write '{}'. Regions: {}"
-                print(msg.format(parameter_name, region_mapping))
-                raise ex
-
-            yield (year, season, day, period, region_id, parameter_name, float(cell))
-            it.iternext()
+    region_mapping = get_region_mapping(parameter_name, conn)
+    try:
+        region_ids = np.array([region_mapping[int(region)] for region in region_names])
+    except KeyError as ex:
+        msg = "Error when trying to write '{}'. Regions: {}"
+        print(msg.format(parameter_name, region_mapping))
+        raise ex
+
+    # parse_season_day_period works element-wise on arrays of interval ids
+    seasons, days, periods = parse_season_day_period(np.array(interval_names, dtype=int))
+
+    values = input_data.as_ndarray()
+    num_regions, num_intervals = len(region_names), len(interval_names)
+    assert values.shape == (num_regions, num_intervals), \
+        "Expected shape {} for {}, got {}".format(
+            (num_regions, num_intervals), parameter_name, values.shape)
+
+    # one row per cell, in the (region, interval) order of the array
+    written = copy_rows(
+        cur, 'input_timestep',
+        ['year', 'season', 'day', 'period', 'region_id', 'parameter', 'value'],
+        [
+            year,
+            np.tile(seasons, num_regions),
+            np.tile(days, num_regions),
+            np.tile(periods, num_regions),
+            np.repeat(region_ids, num_intervals),
+            parameter_name,
+            values.reshape(-1)
+        ])
 
-    # bulk insert of `page_size` records at a time, runs faster than one-row-at-a-time
-    template = "(%s, %s, %s, %s, %s, %s, %s)"
-    psycopg2.extras.execute_values(cur, sql, values(input_data), template, page_size=1000)
-
-    # Make the changes to the database persistent
-    conn.commit()
-
-    # Close communication with the database
     cur.close()
-    conn.close()
+    return written
 
 
-def write_input_annual(data, parameter_name, timestep):
+def write_input_annual(data, parameter_name, timestep, conn):
     assert len(data.dims) == 1, "Expected a single dimension for %s, got %s" % (
         parameter_name, data.dims)
     region_dim_name = data.dims[0]
+    region_ids = np.array(data.spec.dim_coords(region_dim_name).ids, dtype=int)
 
-    conn = establish_connection()
     with conn.cursor() as cur:
         cur.execute(
             'DELETE FROM input_annual WHERE parameter=%s AND year=%s;',
             (parameter_name, timestep)
         )
-        sql = """INSERT INTO
-            input_annual (year, region_id, parameter, value)
-            VALUES (%s, %s, %s, %s)
-            """
-        for region_id, value in data.as_df().itertuples():
-            cur.execute(
-                sql,
-                (timestep, region_id, parameter_name, value)
-            )
-    conn.commit()
-    conn.close()
+        return copy_rows(
+            cur, 'input_annual', ['year', 'region_id', 'parameter', 'value'],
+            [timestep, region_ids, parameter_name, data.as_ndarray().reshape(-1)])
@@ -0,0 +1,353 @@
+import uuid
+
+from energy_supply import (compute_interval_id,
+                           copy_rows,
+                           create_schema,
+                           diff_rows,
+                           establish_connection,
+                           generator_rows,
+                           model_run_schema,
+                           parse_season_day_period,
+                           pipe_rows,
+                           replace_rows,
+                           savepoint,
+                           update_rows,
+                           write_columns_into_array,
+                           write_simduration)
+import numpy as np
+import psycopg2
+import pytest
+
+
+def test_parse_season_day_period_array():
+
+    interval_ids = np.array([1, 24, 25, 238, 385, 672])
+    seasons, days, periods = parse_season_day_period(interval_ids)
+
+    np.testing.assert_equal(seasons, [1, 1, 1, 2, 3, 4])
+    np.testing.assert_equal(days, [1, 1, 2, 3, 3, 7])
+    np.testing.assert_equal(periods, [1, 24, 1, 22, 1, 24])
+    np.testing.assert_equal(compute_interval_id(seasons, days, periods), interval_ids)
+
+
+def test_columns_into_array():
+
+    regions = ['1', '2']
+    intervals = ['1', '2', '3']
+    actual = write_columns_into_array([1, 2, 2], [1, 3, 2], [10.0, 20.0, 30.0],
+                                      regions, intervals)
+    expected = np.array([[10.0, 0, 0],
+                         [0, 30.0, 20.0]])
+    np.testing.assert_equal(actual, expected)
+
+
+def test_columns_into_array_out_of_bounds():
+
+    with pytest.raises(KeyError) as ex:
+        write_columns_into_array([1, 3], [1, 1], [1.0, 2.0], ['1', '2'], ['1'])
+    assert "Region 3 out of bounds" in str(ex.value)
+
+
+def test_generator_rows():
+
+    plants = [
+        {'name': 'ccgt_1', 'type': 'ccgt', 'location': 3, 'to_location': 12,
+         'min_power': 0, 'capacity': {'value': 100}, 'build_year': 2010,
+         'technical_lifetime': {'value': 30}, 'sys_layer': 1},
+        {'name': 'pv_1', 'type': 23, 'location': 5, 'min_power': 0, 'capacity': 2.5,
+         'build_year': 2015, 'technical_lifetime': 25, 'sys_layer': 2},
+    ]
+    actual = generator_rows(plants, 2020)
+
+    assert actual == [
+        {"Type": 1, "GeneratorName": 'ccgt_1', "GasNode": 12, "BusNum": 3,
+         "MinPower": 0.0, "MaxPower": 100.0, "Year": 2020, "Retire": 2040.0, "SysLayer": 1},
+        {"Type": 23, "GeneratorName": 'pv_1', "EH_Conn_Num": 5,
+         "MinPower": 0.0, "MaxPower": 2.5, "Year": 2020, "Retire": 2040.0, "SysLayer": 2},
+    ]
+
+
+def test_generator_rows_missing_keys():
+
+    plants = [
+        {'name': 'a', 'type': 1},
+        {'name': 'b', 'type': 1},
+    ]
+    with pytest.raises(ValueError) as ex:
+        generator_rows(plants, 2020)
+    assert "missing for a" in str(ex.value)
+    assert "missing for b" in str(ex.value)
+
+
+def test_model_run_schema():
+
+    assert model_run_schema('energy_supply_test').startswith('es_energy_supply_test_')
+    assert model_run_schema('arc_es/et-paper Main').startswith('es_et_paper_main_')
+    assert len(model_run_schema('x' * 100)) == 63
+
+
+@pytest.mark.parametrize('names', [
+    ('arc-ws', 'arc_ws'),
+    ('ARC_WS', 'arc_ws'),
+    ('x' * 100 + 'a', 'x' * 100 + 'b'),
+])
+def test_model_run_schema_distinct(names):
+    assert len(set(model_run_schema(name) for name in names)) == len(names)
+
+
+class RecordingCursor(object):
+    """Stands in for a database cursor, recording the statements it runs
+    """
+    def __init__(self, statements):
+        self.statements = statements
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, statement, args=None):
+        self.statements.append(statement)
+
+    def copy_expert(self, statement, buffer):
+        self.statements.append((statement, buffer.read()))
+
+
+class RecordingConnection(object):
+    closed = False
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return RecordingCursor(self.statements)
+
+
+def test_savepoint_reraises_original_error():
+
+    conn = RecordingConnection()
+    with pytest.raises(ValueError) as ex:
+        with savepoint(conn, 'interventions'):
+            raise ValueError("Invalid interventions")
+    assert "Invalid interventions" in str(ex.value)
+    assert conn.statements == [
+        'SAVEPOINT "interventions";',
+        'ROLLBACK TO SAVEPOINT "interventions";',
+    ]
+
+
+def test_savepoint_released():
+
+    conn = RecordingConnection()
+    with savepoint(conn, 'clear_results'):
+        pass
+    assert conn.statements == [
+        'SAVEPOINT "clear_results";',
+        'RELEASE SAVEPOINT "clear_results";',
+    ]
+
+
+def test_copy_rows_escapes_text():
+    cur = RecordingCursor([])
+    written = copy_rows(
+        cur, 'input_annual', ['year', 'region_id', 'parameter', 'value'],
+        [2015, np.array([1, 2]), '50%\tof C:\\gas\n', np.array([0.1, 1e-20])])
+
+    assert written == 2
+    assert cur.statements == [(
+        'COPY "input_annual" (year, region_id, parameter, value) FROM STDIN;',
+        '2015\t1\t50%\\tof C:\\\\gas\\n\t0.1\n'
+        '2015\t2\t50%\\tof C:\\\\gas\\n\t1e-20\n'
+    )]
+
+
+def test_copy_rows_floats_round_trip():
+    cur = RecordingCursor([])
+    values = np.random.RandomState(0).lognormal(size=100)
+    copy_rows(cur, 'input_annual', ['value'], [values])
+
+    text = cur.statements[0][1]
+    np.testing.assert_equal(np.array(text.split(), dtype=np.float64), values)
+
+
+def test_copy_rows_empty():
+    cur = RecordingCursor([])
+    assert copy_rows(cur, 'input_annual', ['year', 'value'], [2015, np.array([])]) == 0
+    assert cur.statements[0][1] == ''
+
+
+@pytest.fixture
+def conn():
+    """Connection to the energy supply database, with an empty schema first on the
+    search path, which is rolled back afterwards
+    """
+    try:
+        conn = establish_connection()
+    except (KeyError, psycopg2.OperationalError):
+        pytest.skip("no energy supply database configured")
+    schema = 'es_test_' + uuid.uuid4().hex
+    with conn.cursor() as cur:
+        cur.execute('CREATE SCHEMA "{0}"; SET LOCAL search_path TO "{0}";'.format(schema))
+    yield conn
+    conn.rollback()
+    conn.close()
+
+
+PIPE_COLUMNS = [('FromNode', True), ('ToNode', True), ('Length', True),
+                ('Diameter', True), ('PipeEff', True), ('MinFlow', True), ('MaxFlow', True)]
+
+
+def pipe(from_node, to_node, length=10):
+    return {'location': from_node, 'to_location': to_node,
+            'length': {'value': length}, 'diameter': {'value': 1.2},
+            'pipeeff': 0.9, 'minflow': 0, 'maxflow': 100}
+
+
+def numbered(rows):
+    return [('row{}'.format(row['PipeNum']), row) for row in rows]
+
+
+def test_diff_rows_unchanged():
+    rows = pipe_rows([pipe(1, 2), pipe(2, 3)], 2015)
+    current = numbered(pipe_rows([pipe(1, 2), pipe(2, 3)], 2015))
+
+    assert diff_rows(current, rows, PIPE_COLUMNS, 'PipeNum') == ([], [], [])
+
+
+def test_diff_rows_updates_year():
+    rows = pipe_rows([pipe(1, 2), pipe(2, 3)], 2015)
+    current = numbered(pipe_rows([pipe(1, 2), pipe(2, 3)], 2010))
+
+    assert diff_rows(current, rows, PIPE_COLUMNS, 'PipeNum') == (
+        [], [], [('row1', rows[0]), ('row2', rows[1])])
+
+
+def test_diff_rows_add_and_remove():
+    current = numbered(pipe_rows([pipe(1, 2), pipe(2, 3)], 2015))
+    rows = pipe_rows([pipe(1, 2), pipe(2, 3), pipe(3, 4)], 2015)
+
+    assert diff_rows(current, rows, PIPE_COLUMNS, 'PipeNum') == ([rows[2]], [], [])
+    assert diff_rows(current, rows[:1], PIPE_COLUMNS, 'PipeNum') == ([], ['row2'], [])
+
+
+def test_diff_rows_key_shift():
+    current = numbered(pipe_rows([pipe(1, 2), pipe(2, 3), pipe(3, 4)], 2015))
+    rows = pipe_rows([pipe(1, 2), pipe(5, 6), pipe(2, 3), pipe(3, 4)], 2015)
+
+    inserts, deletes, updates = diff_rows(current, rows, PIPE_COLUMNS, 'PipeNum')
+    assert inserts == [rows[1]]
+    assert deletes == []
+    assert updates == [('row2', rows[2]), ('row3', rows[3])]
+
+
+def test_diff_rows_changed():
+    current = numbered(pipe_rows([pipe(1, 2), pipe(2, 3)], 2015))
+    rows = pipe_rows([pipe(1, 2), pipe(2, 3, length=20)], 2015)
+
+    assert diff_rows(current, rows, PIPE_COLUMNS, 'PipeNum') == ([rows[1]], ['row2'], [])
+
+
+def test_diff_rows_normalises_values():
+    """Values match as the database stores them, e.g. locations given as strings
+    """
+    current = numbered(pipe_rows([pipe(1, 2)], 2015))
+    current[0][1]['Length'] = 10.0
+    rows = pipe_rows([pipe('1', '2')], 2015)
+
+    assert diff_rows(current, rows, PIPE_COLUMNS, 'PipeNum') == ([], [], [])
+
+
+def test_diff_rows_duplicates():
+    current = numbered(pipe_rows([pipe(1, 2), pipe(1, 2), pipe(1, 2)], 2015))
+    rows = pipe_rows([pipe(1, 2), pipe(1, 2)], 2015)
+
+    assert diff_rows(current, rows, PIPE_COLUMNS, 'PipeNum') == ([], ['row3'], [])
+
+
+PIPE_TABLE = """CREATE TABLE "{}" (
+    "PipeNum" integer, "FromNode" integer, "ToNode" integer, "Year" integer,
+    "Length" double precision, "Diameter" double precision,
+    "PipeEff" double precision, "MinFlow" double precision,
+    "MaxFlow" double precision);"""
+
+
+def test_update_rows(conn):
+    with conn.cursor() as cur:
+        cur.execute(PIPE_TABLE.format('PipeData'))
+    replace_rows('PipeData', pipe_rows([pipe(1, 2), pipe(2, 3), pipe(3, 4)], 2015), conn)
+
+    def table():
+        with conn.cursor() as cur:
+            cur.execute('SELECT ctid::text, * FROM "PipeData" ORDER BY "PipeNum";')
+            return cur.fetchall()
+
+    before = table()
+    assert update_rows(
+        'PipeData', pipe_rows([pipe(1, 2), pipe(5, 6), pipe(2, 3)], 2015), conn) == (1, 1, 1)
+    after = table()
+
+    assert [row[1:] for row in after] == [
+        (1, 1, 2, 2015, 10, 1.2, 0.9, 0, 100),
+        (2, 5, 6, 2015, 10, 1.2, 0.9, 0, 100),
+        (3, 2, 3, 2015, 10, 1.2, 0.9, 0, 100),
+    ]
+    # the first row is untouched
+    assert after[0] == before[0]
+
+    # nothing changes when the interventions are the same
+    assert update_rows(
+        'PipeData', pipe_rows([pipe(1, 2), pipe(5, 6), pipe(2, 3)], 2015), conn) == (0, 0, 0)
+    assert table() == after
+
+
+def test_update_rows_matches_rebuild(conn):
+    """Updating over timesteps leaves the same rows as rewriting the table each timestep
+    """
+    with conn.cursor() as cur:
+        cur.execute(PIPE_TABLE.format('PipeData'))
+        cur.execute(PIPE_TABLE.format('es_test_rebuilt'))
+
+        def contents(table_name):
+            cur.execute('SELECT * FROM "{}" ORDER BY "PipeNum";'.format(table_name))
+            return cur.fetchall()
+
+        timesteps = [
+            (2015, [pipe(1, 2), pipe(2, 3), pipe(3, 4)]),
+            (2020, [pipe(1, 2), pipe(5, 6), pipe(3, 4)]),
+            (2025, [pipe(1, 2), pipe(5, 6), pipe(3, 4, length=20)]),
+        ]
+        for timestep, pipes in timesteps:
+            update_rows('PipeData', pipe_rows(pipes, timestep), conn)
+            replace_rows('es_test_rebuilt', pipe_rows(pipes, timestep), conn)
+
+            assert contents('PipeData') == contents('es_test_rebuilt')
+            assert set(row[3] for row in contents('PipeData')) == {timestep}
+
+
+def test_create_schema(conn):
+    """Views read the copied tables, and tables rewritten every timestep are empty
+    """
+    schema = 'es_test_' + uuid.uuid4().hex
+    with conn.cursor() as cur:
+        cur.execute("""
+            SET LOCAL search_path TO public;
+            CREATE TABLE es_test_costs (cost double precision);
+            CREATE VIEW es_test_total_cost AS SELECT sum(cost) AS total FROM es_test_costs;
+            INSERT INTO es_test_costs VALUES (1.0), (2.0);
+            INSERT INTO input_annual (year, region_id, parameter, value)
+            VALUES (2015, 1, 'es_test_written', 1.0), (2015, 1, 'es_test_kept', 2.0);
+        """)
+        write_simduration(2015, conn)
+
+        assert create_schema(schema, conn, ['es_test_written'])
+        assert not create_schema(schema, conn, ['es_test_written'])
+
+        cur.execute('SET LOCAL search_path TO "{}", public;'.format(schema))
+        cur.execute('INSERT INTO es_test_costs VALUES (4.0);')
+        cur.execute('SELECT total FROM es_test_total_cost;')
+        assert cur.fetchone() == (7.0, )
+        cur.execute('SELECT count(*) FROM "SimDuration";')
+        assert cur.fetchone() == (0, )
+        cur.execute("SELECT parameter FROM input_annual WHERE parameter LIKE 'es_test_%';")
+        assert cur.fetchall() == [('es_test_kept', )]
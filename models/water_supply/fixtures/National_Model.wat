@@ -0,0 +1,46 @@
+WATHNET sysfile for testing
+! Run options
+   1
+  2000
+   365
+  2000
+! Node data
+   3  Res 1   1  0 0
+   details
+   6  Res (A)+   1  0 0
+   details
+   15  Res 5   1  0 0
+   details
+   18  Res 6   1  0 0
+   details
+   33  Res 11   1  0 0
+   details
+   36  Res 12   1  0 0
+   details
+   7  Demand 7   2  0 0
+!--------------------------------------------------------
+Node blocks
+   3  Res 1   1  x y
+  second
+  1 2 9999999  5  1003  7
+	6  Res (A)+   1  x y
+  second
+  1 2 9999999  5  1006  7
+
+15  Res 5   1  x y
+  second
+  1 2 9999999  5  1015  7
+18  Res 6   1  x y
+  second
+  1 2 9999999  5  9018  7
+   18  Res 6   1  x y
+  second
+  1 2 9999999  5  1018  7
+   33  Res 11   1  x y
+  second
+  1 2 9999999  5  1033  7
+   36  Res 12   1  x y
+  second
+  1 2 9999999  5  1036  7
+  itrco = 0;
+end
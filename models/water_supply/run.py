@@ -1,21 +1,245 @@
 """Water supply model
 """
+import csv
+import hashlib
+import json
 import os
 import re
+import runpy
 import shutil
 import subprocess
 import sys
+from configparser import ConfigParser
+from fnmatch import fnmatch
 
 import numpy as np
 import pandas as pd
 
 from smif.model.sector_model import SectorModel
-from smif.data_layer import DataArray
+
+# Static input files installed with water_supply, by path: (modification time, data)
+_STATIC_INPUTS = {}
+
+
+def read_static_csv(filename):
+    """Read an input file which is installed with water_supply once, unless it changes on disk
+
+    The returned DataFrame is shared between calls, so must not be modified in place.
+    """
+    mtime = os.path.getmtime(filename)
+    if filename not in _STATIC_INPUTS or _STATIC_INPUTS[filename][0] != mtime:
+        _STATIC_INPUTS[filename] = (mtime, pd.read_csv(filename, sep=','))
+    return _STATIC_INPUTS[filename][1]
+
+
+# Files written to a model directory during a run, which are never provisioned from the
+# installed model, so that a run cannot write through a link to the installed files
+GENERATED_FILES = [
+    'modified_model*',
+    '*.NEW_DEMANDS',
+    'wathnet.nodal',
+    'nonpublic_water_demand.csv',
+    'demand_profiles.csv',
+    'flows_file.csv',
+    'irrigations_file.csv',
+    'borehole_file.csv',
+]
+
+# Installed files which a run only reads, so may be linked rather than copied into a model
+# directory. Any other installed file is copied, in case a run writes to it.
+LINKED_INPUTS = [
+    '*.exe',
+    '*.dll',
+    'National_Model.wat',
+    'prepare_nodal.py',
+    'CatchmentIndex.csv',
+    'missing_data.csv',
+    'WRZ_DI_DO.csv',
+    'master_dynatop_points.csv',
+]
+
+# Records the files provisioned in a model directory, by path: (installed file, model file)
+# (size, modification time, inode), so unchanged files are not hashed again in each run
+PROVISION_RECORD = '.provisioned.json'
+
+# Content hashes of files, by path: ((modification time, size), sha256)
+_FILE_DIGESTS = {}
+
+
+def is_generated(filename):
+    return any(fnmatch(os.path.basename(filename), pattern) for pattern in GENERATED_FILES)
+
+
+def is_linked_input(filename):
+    return any(fnmatch(os.path.basename(filename), pattern) for pattern in LINKED_INPUTS)
+
+
+def file_key(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def file_sha256(filename):
+    """Hash the contents of a file, once unless it changes on disk
+    """
+    stat = os.stat(filename)
+    key = (stat.st_mtime, stat.st_size)
+    if filename not in _FILE_DIGESTS or _FILE_DIGESTS[filename][0] != key:
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1024 ** 2), b''):
+                digest.update(chunk)
+        _FILE_DIGESTS[filename] = (key, digest.hexdigest())
+    return _FILE_DIGESTS[filename][1]
+
+
+def files_match(installed_file, model_file):
+    """Whether a model file is, or links to, or has the same contents as an installed file
+    """
+    if not os.path.isfile(model_file):
+        return False
+    if os.path.samefile(installed_file, model_file):
+        return True
+    return os.path.getsize(installed_file) == os.path.getsize(model_file) \
+        and file_sha256(installed_file) == file_sha256(model_file)
+
+
+class WathnetSysfile(object):
+    """A WATHNET sysfile held in memory
+
+    The file is read and indexed once, so that the run options, reservoir levels and
+    interventions can all be edited in place before writing a single modified copy.
+
+    Arguments
+    ---------
+    lines : list[str]
+        The lines of the sysfile, including line endings
+    """
+    RUN_OPTIONS = '! Run options'
+    NODE_DATA = '! Node data'
+    NODE_DATA_END = '!--------------------------------------------------------'
+    NO_INTERVENTION = 'itrco = 0;'
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.sha256 = hashlib.sha256(''.join(lines).encode('utf-8')).hexdigest()
+        self.run_options = []
+        self.node_data = None
+        self.interventions = []
+        self.node_lines = {}
+
+        node_data_start = None
+        for idx, line in enumerate(lines):
+            if self.RUN_OPTIONS in line:
+                self.run_options.append(idx)
+            if self.NO_INTERVENTION in line:
+                self.interventions.append(idx)
+            if node_data_start is None:
+                if self.NODE_DATA in line:
+                    node_data_start = idx
+            elif self.node_data is None and self.NODE_DATA_END in line:
+                self.node_data = (node_data_start, idx)
+
+            # Candidate node blocks, keyed on the node number which leads the line
+            tokens = line.split(None, 1)
+            if tokens and tokens[0].isdigit():
+                self.node_lines.setdefault(tokens[0], []).append(idx)
+
+    @classmethod
+    def read(cls, filename):
+        with open(filename, 'r') as fh:
+            return cls(fh.readlines())
+
+    def write(self, filename):
+        with open(filename, 'w') as fh:
+            fh.write(''.join(self.lines))
+        return filename
+
+    def get_node_data(self):
+        """The '! Node data' section, with all but the first line stripped of whitespace
+        """
+        assert self.node_data is not None, "Expected to find '{}' section in sysfile".format(self.NODE_DATA)
+        start, end = self.node_data
+        return '\n'.join([self.lines[start]] + [line.strip() for line in self.lines[start + 1:end + 1]])
+
+    def set_run_options(self, run_options):
+        """Replace the four lines which follow the unique '! Run options' line
+        """
+        assert len(self.run_options) == 1, \
+            "Expected to find '{}' exactly once in sysfile".format(self.RUN_OPTIONS)
+        start = self.run_options[0] + 1
+        self.lines[start:start + 4] = run_options
+
+    def set_intervention(self, option_number):
+        for idx in self.interventions:
+            self.lines[idx] = self.lines[idx].replace(
+                self.NO_INTERVENTION, 'itrco = {};'.format(option_number))
+
+    def find_reservoir_volume(self, node_num, res_name):
+        """Locate the initial volume in the block for a reservoir node
+
+        Returns
+        =======
+        location : tuple(int, int, int) or None
+            The line and the start and end columns of the volume within that line
+        """
+        # Pattern (<...>)\d+ where the group (<...>) matches based on the node number and reservoir name
+        # and the \d+ is the number that is to be replaced
+        regex_pattern = re.compile(r'^(\s*{}\s+{}\s+1.*\n.*\n.*9999999\s+\d+\s+)\d+'.format(
+            node_num, re.escape(res_name)
+        ))
+
+        # Only the few lines following each candidate node line need to be searched. As when
+        # searching the whole file for '\n\s+<node_num>', the node line must be indented or
+        # follow a blank line
+        for idx in self.node_lines.get(str(node_num), []):
+            indented = idx >= 1 and self.lines[idx][:1].isspace()
+            after_blank = idx >= 2 and not self.lines[idx - 1].strip()
+            if not (indented or after_blank):
+                continue
+            m = regex_pattern.match(''.join(self.lines[idx:idx + 5]))
+            if m is not None:
+                prefix = m.group(1)
+                start = len(prefix) - (prefix.rfind('\n') + 1)
+                return idx + prefix.count('\n'), start, start + m.end() - m.end(1)
+        return None
+
+    def set_value(self, line, start, end, value):
+        """Replace the characters between the start and end columns of a line
+        """
+        text = self.lines[line]
+        self.lines[line] = '{}{}{}'.format(text[:start], value, text[end:])
 
 
 class WaterWrapper(SectorModel):
     """Water Model Wrapper
     """
+    _config_filename = 'run_config.ini'
+
+    def __init__(self, *args, **kwargs):
+        self._set_options()
+        super().__init__(*args, **kwargs)
+        self._reservoir_index = None
+
+    def _set_options(self):
+        config = ConfigParser()
+        config.read(os.path.join(os.path.dirname(__file__), self._config_filename))
+        if 'run' not in config:
+            config['run'] = {}
+
+        # Run the prepare_nodal script in this interpreter, rather than starting a new one
+        self._prepare_nodal_in_process = config['run'].getboolean(
+            'prepare_nodal_in_process', fallback=False)
+
+        # How each model run's exe and nodal files are provided from the installed model,
+        # unless set for an ensemble of model runs by utilities/run_arc_ws_ensemble.py
+        self._provision_mode = os.environ.get(
+            'WATER_SUPPLY_PROVISION_MODE',
+            config['run'].get('provision_mode', fallback='copy'))
+        if self._provision_mode not in ('copy', 'hardlink', 'symlink'):
+            raise ValueError(
+                "Expected provision_mode copy, hardlink or symlink, got {}".format(
+                    self._provision_mode))
 
     def before_model_run(self, data_handle=None):
         """Implement this method to conduct pre-model run tasks
@@ -50,18 +274,109 @@ class WaterWrapper(SectorModel):
 
         base_exe_dir = os.path.join(base_dir, 'exe')
         model_exe_dir = os.path.join(model_dir, 'exe')
-        try:
-            shutil.copytree(base_exe_dir, model_exe_dir)
-        except FileExistsError:
-            pass
+        self.provision_dir(base_exe_dir, model_exe_dir, self._provision_mode)
 
         base_nodal_dir = os.path.join(base_dir, 'nodal')
         model_nodal_dir = os.path.join(model_dir, 'nodal')
-        try:
-            shutil.copytree(base_nodal_dir, model_nodal_dir)
-        except FileExistsError:
-            pass
+        self.provision_dir(base_nodal_dir, model_nodal_dir, self._provision_mode)
+
+        # Index the reservoir nodes once, so each timestep can write reservoir levels directly
+        sysfile = os.path.join(model_exe_dir, 'National_Model.wat')
+        assert(os.path.isfile(sysfile)), "Expected to find water supply sysfile at {}".format(sysfile)
+        reservoir_names = [
+            x['name'] for x in self.outputs['reservoir_levels'].dim_coords('water_supply/reservoir_names').elements
+        ]
+        self._reservoir_index = self.load_reservoir_index(
+            os.path.join(model_dir, 'reservoir_index.json'), WathnetSysfile.read(sysfile), reservoir_names)
+
+    @staticmethod
+    def provision_dir(base_dir, model_dir, mode='copy'):
+        """Provides the installed model files in a model run's directory, verifying any which exist.
+
+        Existing files are kept if they link to or have the same contents as the installed
+        files, and are replaced otherwise. Only the files in LINKED_INPUTS are linked, the
+        rest are copied. Files which are generated during a run are not provided, and are
+        removed if left as links to another file. Any other file which is not installed is
+        removed.
+
+        The files provided are recorded in the model directory, and files which have not
+        changed on disk since are kept without comparing their contents.
+
+        Arguments
+        ---------
+        base_dir : str
+            Path to the installed directory, e.g. 'exe' or 'nodal'
 
+        model_dir : str
+            Path to the directory for the model run
+
+        mode : str, default='copy'
+            One of 'copy', 'hardlink' (falling back to a copy where files cannot be linked),
+            or 'symlink'
+        """
+        record_file = os.path.join(model_dir, PROVISION_RECORD)
+        try:
+            with open(record_file, 'r') as fh:
+                record = json.load(fh)
+        except (OSError, ValueError):
+            record = {}
+
+        provided = {}
+        for root, _, filenames in os.walk(base_dir):
+            model_root = os.path.normpath(os.path.join(model_dir, os.path.relpath(root, base_dir)))
+            os.makedirs(model_root, exist_ok=True)
+
+            for filename in filenames:
+                base_file = os.path.join(root, filename)
+                model_file = os.path.join(model_root, filename)
+                if is_generated(filename):
+                    continue
+                linked = is_linked_input(filename)
+
+                relpath = os.path.relpath(model_file, model_dir)
+                keys = [file_key(base_file), file_key(model_file)] \
+                    if os.path.isfile(model_file) else None
+                if keys is not None and record.get(relpath) == keys:
+                    provided[relpath] = keys
+                    continue
+
+                if files_match(base_file, model_file) and (linked or not (
+                        os.path.islink(model_file) or os.path.samefile(base_file, model_file))):
+                    provided[relpath] = keys
+                    continue
+
+                if os.path.lexists(model_file):
+                    os.remove(model_file)
+
+                if linked and mode == 'symlink':
+                    os.symlink(os.path.abspath(base_file), model_file)
+                elif linked and mode == 'hardlink':
+                    try:
+                        os.link(base_file, model_file)
+                    except OSError:
+                        shutil.copy2(base_file, model_file)
+                else:
+                    shutil.copy2(base_file, model_file)
+                provided[relpath] = [file_key(base_file), file_key(model_file)]
+
+        for root, dirnames, filenames in os.walk(model_dir):
+            base_root = os.path.normpath(os.path.join(base_dir, os.path.relpath(root, model_dir)))
+            for dirname in list(dirnames):
+                if not os.path.isdir(os.path.join(base_root, dirname)):
+                    shutil.rmtree(os.path.join(root, dirname))
+                    dirnames.remove(dirname)
+
+            for filename in filenames:
+                model_file = os.path.join(root, filename)
+                if is_generated(filename):
+                    if os.path.islink(model_file) or os.stat(model_file).st_nlink > 1:
+                        os.remove(model_file)
+                elif os.path.relpath(model_file, model_dir) not in provided \
+                        and model_file != record_file:
+                    os.remove(model_file)
+
+        with open(record_file, 'w') as fh:
+            json.dump(provided, fh)
 
     def _get_model_dir(self, data_handle):
         return os.path.join(
@@ -96,21 +411,23 @@ class WaterWrapper(SectorModel):
         # This is the national model file, which must be edited in various ways:
         sysfile = os.path.join(exe_dir, 'National_Model.wat')
         assert(os.path.isfile(sysfile)), "Expected to find water supply sysfile at {}".format(sysfile)
+        model = WathnetSysfile.read(sysfile)
 
         # Inject the current simulation period (current timestep)
-        sysfile = self.inject_simulation_days(sysfile, data_handle.current_timestep)
-        assert(os.path.isfile(sysfile)), "Expected to find water supply sysfile at {}".format(sysfile)
+        self.inject_simulation_days(model, data_handle.current_timestep)
 
         # Inject the reservoir levels from the previous timestep
-        sysfile = self.inject_reservoir_levels(sysfile, reservoir_levels)
-        assert(os.path.isfile(sysfile)), "Expected to find water supply sysfile at {}".format(sysfile)
+        self.inject_reservoir_levels(model, reservoir_levels, self._reservoir_index)
 
         # Set intervention
-        sysfile = self.set_interventions(sysfile, data_handle.get_current_interventions())
+        self.set_interventions(model, data_handle.get_current_interventions())
+
+        # All edits are made in memory, then written out once
+        sysfile = model.write(os.path.join(exe_dir, 'modified_model.wat'))
         assert(os.path.isfile(sysfile)), "Expected to find water supply sysfile at {}".format(sysfile)
 
         # This is the nodal file which is generated from various static data files
-        nodal_file = self.prepare_nodal(data_handle, nodal_dir)
+        nodal_file = self.prepare_nodal(data_handle, nodal_dir, self._prepare_nodal_in_process)
         assert(os.path.isfile(nodal_file))
 
         subprocess.call([
@@ -159,7 +476,7 @@ class WaterWrapper(SectorModel):
         )
 
     @staticmethod
-    def prepare_nodal(data_handle, nodal_dir):
+    def prepare_nodal(data_handle, nodal_dir, in_process=False):
         """Generates the nodal file necessary for the Wathnet model run. The script to prepare the nodal file requires
         a number of csv files as parameters. Some of these data come via the data_handle as either parameters or
         scenario data, and some are installed with the water_supply model. Those that come via the data_handle must be
@@ -174,6 +491,9 @@ class WaterWrapper(SectorModel):
         nodal_dir : str
             Path to the directory containing the necessary files for preparing the nodal file.
 
+        in_process : bool, default=False
+            Whether to run the prepare_nodal script in this interpreter
+
         Returns
         =======
         output_file : str
@@ -342,8 +662,7 @@ class WaterWrapper(SectorModel):
 
         output_file = os.path.join(nodal_dir, 'wathnet.nodal')
 
-        subprocess.call([
-            sys.executable, prepare_nodal,
+        args = [
             '--FlowFile', flows_file,
             '--DemandFile', irrigations_file,
             '--CatchmentFile', catchment_file,
@@ -355,61 +674,99 @@ class WaterWrapper(SectorModel):
             '--DynatopFile', dynatop_file,
             '--OutputFile', output_file,
             '--Year', str(data_handle.current_timestep),
-        ])
+        ]
+
+        WaterWrapper.call_script(prepare_nodal, args, nodal_dir, in_process)
 
         assert(os.path.isfile(output_file)), "Expected to find WATHNET nodal file at {}".format(output_file)
         return output_file
 
     @staticmethod
-    def inject_simulation_days(sysfile, year_now):
-        """Injects the current year into the sysfile so that the current year is simulated.
+    def call_script(script, args, cwd, in_process=False):
+        """Runs a python script from the command line, or as if from the command line.
 
         Arguments
         ---------
-        sysfile : str
-            Path to the sysfile ('National_Model.wat')
+        script : str
+            Path to the script
 
-        year_now: int
-            The year to be simulated
+        args : list[str]
+            Command line arguments to the script
 
-        Returns
-        =======
-        sysfile : str
-            The name of the new wathnet sysfile
-        """
+        cwd : str
+            Working directory to run the script in
 
-        modified_sysfile = os.path.join(os.path.dirname(sysfile), 'modified_model.wat')
+        in_process : bool, default=False
+            Whether to run the script in this interpreter, see `run_script`
+        """
+        if in_process:
+            WaterWrapper.run_script(script, args, cwd)
+        else:
+            subprocess.call([sys.executable, script] + args, cwd=cwd)
 
-        # This is the unique line directly before the lines we need to edit
-        # We should hit this exactly once, which we use to test that nothing has gone wrong
-        sentinel_line = '! Run options'
-        sentinel_lines_hit = 0
+    @staticmethod
+    def run_script(script, args, cwd=None):
+        """Runs a python script as __main__ in this interpreter, as if from the command line.
 
-        # String that we want to edit in place
-        new_string = '   {}\n  {}\n   {}\n  {}\n'.format('1', str(year_now), '365', str(year_now))
+        As for a new interpreter, the script's directory is first on the module search path,
+        and modules imported from there are forgotten afterwards. The working directory is
+        changed for the whole process while the script runs, so this must not be called
+        from more than one thread at once.
 
-        with open(modified_sysfile, 'w') as new_file:
-            with open(sysfile, 'r') as old_file:
+        Arguments
+        ---------
+        script : str
+            Path to the script
 
-                # Write every line from the old file directly into the new file
-                for line in old_file:
-                    new_file.write(line)
+        args : list[str]
+            Command line arguments to the script
 
-                    # If we see the sentinel, skip 4 lines in the old file and
-                    # write the replacement string out instead to the new file
-                    if sentinel_line in line:
+        cwd : str, default=None
+            Working directory to run the script in, if not the current one
+        """
+        script_dir = os.path.dirname(os.path.abspath(script))
+        argv = sys.argv
+        path = list(sys.path)
+        modules = set(sys.modules)
+        old_cwd = os.getcwd()
+
+        sys.argv = [script] + args
+        sys.path.insert(0, script_dir)
+        try:
+            if cwd is not None:
+                os.chdir(cwd)
+            runpy.run_path(script, run_name='__main__')
+        except SystemExit as ex:
+            if ex.code:
+                raise RuntimeError('{} exited with status {}'.format(script, ex.code))
+        finally:
+            os.chdir(old_cwd)
+            sys.argv = argv
+            sys.path[:] = path
+            for name in set(sys.modules) - modules:
+                filename = getattr(sys.modules[name], '__file__', None)
+                if filename and os.path.abspath(filename).startswith(script_dir + os.sep):
+                    del sys.modules[name]
 
-                        old_file.readline()
-                        old_file.readline()
-                        old_file.readline()
-                        old_file.readline()
+    @staticmethod
+    def inject_simulation_days(sysfile, year_now):
+        """Injects the current year into the sysfile so that the current year is simulated.
 
-                        sentinel_lines_hit += 1
-                        new_file.write(new_string)
+        Arguments
+        ---------
+        sysfile : WathnetSysfile
+            The sysfile ('National_Model.wat') to edit in place
 
-        assert(sentinel_lines_hit == 1)
+        year_now: int
+            The year to be simulated
 
-        return modified_sysfile
+        Returns
+        =======
+        sysfile : WathnetSysfile
+            The edited wathnet sysfile
+        """
+        sysfile.set_run_options(['   1\n', '  {}\n'.format(year_now), '   365\n', '  {}\n'.format(year_now)])
+        return sysfile
 
     @staticmethod
     def set_interventions(sysfile, interventions):
@@ -433,81 +790,116 @@ class WaterWrapper(SectorModel):
         # itrco = 3 - s lincs reservoir;
         # itrco = 4 - abingdon storage;
         # itrco = 5 - beckton reuse;
-
-        # open file
-        with open(sysfile, 'r') as fh:
-            original_text = fh.read()
-
-        # modify
-        new_text = original_text.replace("itrco = 0;", "itrco = {};".format(option_number))
-
-        # save modified file
-        new_sysfile = sysfile.replace('.wat', '_with_intervention.wat')
-        with open(new_sysfile, 'w') as fh:
-            fh.write(new_text)
-
-        return new_sysfile
+        sysfile.set_intervention(option_number)
+        return sysfile
 
     @staticmethod
-    def inject_reservoir_levels(sysfile, reservoir_levels):
+    def inject_reservoir_levels(sysfile, reservoir_levels, reservoir_index=None):
         """Injects reservoir levels passed in through the smif data handle to the Wathnet sysfile.
 
         Arguments
         ---------
-        sysfile : str
-            Path to the sysfile ('National_Model.wat')
+        sysfile : WathnetSysfile
+            The sysfile ('National_Model.wat') to edit in place
 
         reservoir_levels: smif.data_layer.DataArray
             The reservoir levels to inject into the sysfile
 
+        reservoir_index: dict, optional
+            The index of reservoir locations from `build_reservoir_index`, which is rebuilt
+            if it does not match the sysfile
+
         Returns
         =======
-        sysfile : str
-            The name of the new wathnet sysfile
+        sysfile : WathnetSysfile
+            The edited wathnet sysfile
         """
 
-        res_names = np.array([x['name'] for x in reservoir_levels.dim_coords('water_supply/reservoir_names').elements])
+        res_names = [x['name'] for x in reservoir_levels.dim_coords('water_supply/reservoir_names').elements]
         res_vols = reservoir_levels.data
 
-        node_num_dict = WaterWrapper.get_reservoir_node_numbers(sysfile, res_names)
+        if not WaterWrapper.reservoir_index_matches(reservoir_index, sysfile, res_names):
+            reservoir_index = WaterWrapper.build_reservoir_index(sysfile, res_names)
 
-        with open(sysfile, 'r') as my_f:
-            original_file = my_f.read()
+        # Write each volume directly to its location in the sysfile
+        for res_name, res_vol in zip(res_names, res_vols):
+            _, line, start, end = reservoir_index['reservoirs'][res_name]
+            sysfile.set_value(line, start, end, int(res_vol))
 
-        # A string not in the original file, for keeping track of the number of successful substitutions
-        sentinel = r'#~@@~#'
-        assert sentinel not in original_file
+        return sysfile
 
-        # Perform the required substitutions
-        for res_name, res_vol in zip(res_names, res_vols):
+    @staticmethod
+    def build_reservoir_index(sysfile, reservoir_names):
+        """Locates the node number and initial volume of each reservoir in the wathnet sysfile.
 
-            # Pattern (<...>)\d+ where the group (<...>) matches based on the node number and reservoir name
-            # and the \d+ is the number that is to be replaced by the substitution
-            regex_pattern = r'(\n\s+{}\s+{}\s+1.*\n.*\n.*9999999\s+\d+\s+)\d+'.format(
-                node_num_dict[res_name], re.escape(res_name)
-            )
+        Arguments
+        ---------
+        sysfile : WathnetSysfile
+            The parsed sysfile ('National_Model.wat')
 
-            # Keep the first group (\g<1>) unchanged, then add the correct volume and the sentinel
-            original_file = re.sub(
-                pattern=regex_pattern,
-                repl=r'\g<1>{}{}'.format(int(res_vol), sentinel),
-                string=original_file,
-                count=1
-            )
+        reservoir_names: List[str]
+            List of reservoir names
+
+        Returns
+        =======
+        reservoir_index : dict
+            The sysfile hash, and a mapping from reservoir name to node number and the
+            line, start and end columns of its initial volume
+        """
+        node_num_dict = WaterWrapper.get_reservoir_node_numbers(sysfile, reservoir_names)
 
-        # The number of occurrences of the sentinel should equal the number of reservoirs.
-        # If not, at least one replacement did not occur as expected.
-        num_sentinels = original_file.count(sentinel)
-        assert num_sentinels == len(res_names), \
-            'Only {}/{} reservoir levels were replaced. Something went wrong!'.format(num_sentinels, len(res_names))
+        reservoirs = {}
+        for res_name in reservoir_names:
+            location = sysfile.find_reservoir_volume(node_num_dict[res_name], res_name)
+            if location is not None:
+                reservoirs[str(res_name)] = [node_num_dict[res_name]] + list(location)
 
-        # Finally, write out a new file, removing the sentinels
-        new_filename = sysfile.replace('.wat', '_with_res_vols.wat')
+        assert len(reservoirs) == len(reservoir_names), \
+            'Only {}/{} reservoir levels were found. Something went wrong!'.format(
+                len(reservoirs), len(reservoir_names))
 
-        with open(new_filename, 'w') as my_f:
-            my_f.write(original_file.replace(sentinel, ''))
+        return {'sha256': sysfile.sha256, 'reservoirs': reservoirs}
 
-        return new_filename
+    @staticmethod
+    def reservoir_index_matches(reservoir_index, sysfile, reservoir_names):
+        """Whether a reservoir index was built from this sysfile and covers all the reservoirs
+        """
+        return reservoir_index is not None \
+            and reservoir_index['sha256'] == sysfile.sha256 \
+            and all(res_name in reservoir_index['reservoirs'] for res_name in reservoir_names)
+
+    @staticmethod
+    def load_reservoir_index(index_file, sysfile, reservoir_names):
+        """Reads the reservoir index saved by a previous run, rebuilding and saving it if missing or stale.
+
+        Arguments
+        ---------
+        index_file : str
+            Path to the saved reservoir index
+
+        sysfile : WathnetSysfile
+            The parsed sysfile ('National_Model.wat')
+
+        reservoir_names: List[str]
+            List of reservoir names
+
+        Returns
+        =======
+        reservoir_index : dict
+            See `build_reservoir_index`
+        """
+        try:
+            with open(index_file, 'r') as fh:
+                reservoir_index = json.load(fh)
+        except (OSError, ValueError):
+            reservoir_index = None
+
+        if not WaterWrapper.reservoir_index_matches(reservoir_index, sysfile, reservoir_names):
+            reservoir_index = WaterWrapper.build_reservoir_index(sysfile, reservoir_names)
+            with open(index_file, 'w') as fh:
+                json.dump(reservoir_index, fh, indent=2)
+
+        return reservoir_index
 
     @staticmethod
     def get_reservoir_node_numbers(sysfile, reservoir_names):
@@ -515,8 +907,8 @@ class WaterWrapper(SectorModel):
 
         Arguments
         ---------
-        sysfile : str
-            Path to the sysfile ('National_Model.wat')
+        sysfile : WathnetSysfile
+            The parsed sysfile ('National_Model.wat')
 
         reservoir_names: List[str]
             List of reservoir names
@@ -527,20 +919,9 @@ class WaterWrapper(SectorModel):
             Mapping from reservoir name to integer node number
         """
 
-        # For efficiency, we pull out the relevant part of the sysfile,
+        # For efficiency, we only search the relevant part of the sysfile,
         # between '! Node data' and '!-------------------------------'
-        with open(sysfile, 'r') as my_file:
-            line = ''
-            while '! Node data' not in line:
-                line = my_file.readline()
-
-            node_data_lines = [line]
-
-            while '!--------------------------------------------------------' not in line:
-                line = my_file.readline()
-                node_data_lines.append(line.strip())
-
-        node_data = '\n'.join(node_data_lines)
+        node_data = sysfile.get_node_data()
 
         # Populate the dictionary mapping reservoir name to node number
         node_num_dict = {}
@@ -551,7 +932,7 @@ class WaterWrapper(SectorModel):
             regex_pattern = r'\n(\d+)\s+{}\s+1\s+'.format(re.escape(res_name))
             m = re.search(regex_pattern, node_data)
 
-            assert m is not None, 'Expected to find a match for {} in {}'.format(regex_pattern, sysfile)
+            assert m is not None, 'Expected to find a match for {} in sysfile'.format(regex_pattern)
 
             node_num_dict[res_name] = m.group(1)
 
@@ -579,11 +960,8 @@ class WaterWrapper(SectorModel):
 
         new_public_file = public_file + ".NEW_DEMANDS"
 
-        # Read template file
-        public_df = pd.read_csv(
-            public_file,
-            sep=',',
-        )
+        # Read template file, which is the same for every timestep
+        public_df = read_static_csv(public_file)
 
         # Merge, replacing values for 'Distribution Input'
         smif_demand_df = demand_data.as_df().reset_index()
@@ -608,6 +986,8 @@ class WaterWrapper(SectorModel):
     def extract_wathnet_output(output_file, spec):
         """Given a Wathnet output file, extracts the data smif is expecting, verifying the spec matches.
 
+        Columns and days are read directly into an array in the order of the spec coordinates.
+
         Arguments
         ---------
         output_file : str
@@ -621,23 +1001,31 @@ class WaterWrapper(SectorModel):
             The data from the output file
         """
 
-        # Read the output file and melt it on the column "Day"
-        output_df = pd.read_csv(
-            output_file,
-            sep=',',
-            skiprows=1,  # All wathnet output contains a single row of description
-            usecols=lambda col: col.lower() not in ['replicate', 'year'],
-        ).melt(id_vars=['Day'])
+        days = spec.dim_coords(spec.dims[0]).ids
+        names = spec.dim_coords(spec.dims[1]).ids
 
-        # Rename the columns to match the spec object
-        output_df.rename(
-            inplace=True,
-            columns={
-                'Day': spec.dims[0],
-                'variable': spec.dims[1],
-                'value': spec.name,
-            }
-        )
+        with open(output_file, 'r') as output_fh:
+            output_fh.readline()  # All wathnet output contains a single row of description
+            header = next(csv.reader(output_fh))
+            values = pd.read_csv(output_fh, sep=',', header=None, dtype=float).values
 
-        # Returning via DataArray.from_df will check that the data matches the spec as expected
-        return DataArray.from_df(spec=spec, dataframe=output_df).data
+        # Map the columns of the output file onto the order of the spec
+        column_index = {name: idx for idx, name in enumerate(header)}
+        missing = [name for name in ['Day'] + list(names) if name not in column_index]
+        if missing:
+            raise ValueError('Expected to find columns {} in {}'.format(missing, output_file))
+        columns = [column_index[name] for name in names]
+
+        # Map each row of the output file onto the position of its day in the spec
+        day_index = {str(day): idx for idx, day in enumerate(days)}
+        try:
+            rows = [day_index[str(int(day))] for day in values[:, column_index['Day']]]
+        except (KeyError, ValueError) as ex:
+            raise ValueError('Unexpected day {} in {}'.format(ex, output_file))
+        if len(rows) != len(days) or len(set(rows)) != len(days):
+            raise ValueError('Expected one row for each of {} days in {}, got {} rows'.format(
+                len(days), output_file, len(rows)))
+
+        data = np.empty(spec.shape, dtype=float)
+        data[rows] = values[:, columns]
+        return data
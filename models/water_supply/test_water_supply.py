@@ -0,0 +1,359 @@
+"""Tests for the water supply wrapper
+"""
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('smif')
+
+
+def load_wrapper_module():
+    """Import run.py under its own name, as other model directories have a run.py too
+    """
+    spec = importlib.util.spec_from_file_location(
+        'water_supply_run', os.path.join(os.path.dirname(__file__), 'run.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+run = load_wrapper_module()
+WaterWrapper = run.WaterWrapper
+
+
+class DummyCoords(object):
+    def __init__(self, ids):
+        self.ids = ids
+
+
+class DummySpec(object):
+    """Days by names, as the specs of the WATHNET outputs
+    """
+    def __init__(self, days, names):
+        self.dims = ['days', 'names']
+        self.coords = {'days': DummyCoords(days), 'names': DummyCoords(names)}
+        self.shape = (len(days), len(names))
+
+    def dim_coords(self, dim):
+        return self.coords[dim]
+
+
+def write_output(tmpdir, lines):
+    output_file = tmpdir.join('modified_model_reservoirEndVolume.csv')
+    output_file.write('Reservoir end volumes\n' + '\n'.join(lines) + '\n')
+    return str(output_file)
+
+
+def test_extract_wathnet_output(tmpdir):
+    """Columns and days are read in the order of the spec, whatever their order in the file
+    """
+    output_file = write_output(tmpdir, [
+        'Day,Other,B,A',
+        '2,0,22.5,21',
+        '1,0,12.5,11',
+        '3,0,32.5,31',
+    ])
+    spec = DummySpec([1, 2, 3], ['A', 'B'])
+
+    data = WaterWrapper.extract_wathnet_output(output_file, spec)
+
+    np.testing.assert_equal(data, [[11, 12.5], [21, 22.5], [31, 32.5]])
+
+
+def test_extract_wathnet_output_missing_column(tmpdir):
+    output_file = write_output(tmpdir, ['Day,A', '1,11', '2,21'])
+    spec = DummySpec([1, 2], ['A', 'B'])
+
+    with pytest.raises(ValueError, match='columns'):
+        WaterWrapper.extract_wathnet_output(output_file, spec)
+
+
+def test_extract_wathnet_output_unexpected_day(tmpdir):
+    output_file = write_output(tmpdir, ['Day,A', '1,11', '4,41'])
+    spec = DummySpec([1, 2], ['A'])
+
+    with pytest.raises(ValueError, match='Unexpected day'):
+        WaterWrapper.extract_wathnet_output(output_file, spec)
+
+
+@pytest.mark.parametrize('days', [['1', '2'], ['1', '1', '2']])
+def test_extract_wathnet_output_missing_or_repeated_day(tmpdir, days):
+    output_file = write_output(tmpdir, ['Day,A'] + [day + ',1' for day in days])
+    spec = DummySpec([1, 2, 3], ['A'])
+
+    with pytest.raises(ValueError, match='one row for each'):
+        WaterWrapper.extract_wathnet_output(output_file, spec)
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class DummyReservoirLevels(object):
+    """Reservoir levels, as the smif DataArray for 'reservoir_levels'
+    """
+    def __init__(self, names, data):
+        self.names = names
+        self.data = data
+
+    def dim_coords(self, dim):
+        coords = DummyCoords([])
+        coords.elements = [{'name': name} for name in self.names]
+        return coords
+
+
+RESERVOIR_LEVELS = DummyReservoirLevels(
+    ['Res 12', 'Res 11', 'Res 6', 'Res 5', 'Res (A)+', 'Res 1'],
+    np.arange(6) * 10.5 + 3)
+
+
+def modify_sysfile(reservoir_index=None):
+    sysfile = run.WathnetSysfile.read(os.path.join(FIXTURES, 'National_Model.wat'))
+    WaterWrapper.inject_simulation_days(sysfile, 2031)
+    WaterWrapper.inject_reservoir_levels(sysfile, RESERVOIR_LEVELS, reservoir_index)
+    WaterWrapper.set_interventions(sysfile, {'option': {'option_number': 3}})
+    return sysfile
+
+
+def test_modify_sysfile(tmpdir):
+    """The modified sysfile is the same as from editing the file with a regex per reservoir
+
+    fixtures/modified_model.wat was written by the earlier implementation, which searched
+    the whole file for each reservoir.
+    """
+    sysfile = modify_sysfile()
+    modified = sysfile.write(str(tmpdir.join('modified_model.wat')))
+
+    with open(modified, 'rb') as actual, \
+            open(os.path.join(FIXTURES, 'modified_model.wat'), 'rb') as expected:
+        assert actual.read() == expected.read()
+
+
+def test_find_reservoir_volume():
+    sysfile = run.WathnetSysfile([
+        'Node blocks\n',
+        '18  Res 6   1  x y\n', '  second\n', '  1 2 9999999  5  9018  7\n',
+        '\n',
+        '18  Res 6   1  x y\n', '  second\n', '  1 2 9999999  5  1018  7\n',
+    ])
+
+    # the first block is not indented and does not follow a blank line
+    line, start, end = sysfile.find_reservoir_volume('18', 'Res 6')
+    assert (line, sysfile.lines[line][start:end]) == (7, '1018')
+    assert sysfile.find_reservoir_volume('1', 'Res 6') is None
+
+
+@pytest.fixture
+def count_builds(monkeypatch):
+    """Count calls to WaterWrapper.build_reservoir_index
+    """
+    calls = []
+    build = WaterWrapper.build_reservoir_index
+
+    def counted(sysfile, reservoir_names):
+        calls.append(reservoir_names)
+        return build(sysfile, reservoir_names)
+
+    monkeypatch.setattr(WaterWrapper, 'build_reservoir_index', staticmethod(counted))
+    return calls
+
+
+def test_build_reservoir_index():
+    sysfile = run.WathnetSysfile.read(os.path.join(FIXTURES, 'National_Model.wat'))
+
+    index = WaterWrapper.build_reservoir_index(sysfile, RESERVOIR_LEVELS.names)
+
+    assert index['sha256'] == sysfile.sha256
+    assert sorted(index['reservoirs']) == sorted(RESERVOIR_LEVELS.names)
+    node, line, start, end = index['reservoirs']['Res 6']
+    assert (node, sysfile.lines[line][start:end]) == ('18', '1018')
+
+
+def test_load_reservoir_index(tmpdir, count_builds):
+    index_file = str(tmpdir.join('reservoir_index.json'))
+    sysfile = run.WathnetSysfile.read(os.path.join(FIXTURES, 'National_Model.wat'))
+
+    index = WaterWrapper.load_reservoir_index(index_file, sysfile, RESERVOIR_LEVELS.names)
+    assert os.path.isfile(index_file)
+    assert len(count_builds) == 1
+
+    # read from the file, and gives the same sysfile edits
+    assert WaterWrapper.load_reservoir_index(
+        index_file, sysfile, RESERVOIR_LEVELS.names) == index
+    assert len(count_builds) == 1
+    assert modify_sysfile(index).lines == modify_sysfile().lines
+
+
+def test_load_reservoir_index_stale(tmpdir, count_builds):
+    index_file = str(tmpdir.join('reservoir_index.json'))
+    sysfile = run.WathnetSysfile.read(os.path.join(FIXTURES, 'National_Model.wat'))
+    index = WaterWrapper.load_reservoir_index(index_file, sysfile, RESERVOIR_LEVELS.names)
+
+    # a changed sysfile
+    changed = run.WathnetSysfile(['! Changed\n'] + sysfile.lines)
+    changed_index = WaterWrapper.load_reservoir_index(
+        index_file, changed, RESERVOIR_LEVELS.names)
+    assert len(count_builds) == 2
+    assert changed_index['sha256'] == changed.sha256
+    assert changed_index['reservoirs']['Res 1'][1] == index['reservoirs']['Res 1'][1] + 1
+
+    # a reservoir missing from the index
+    tmpdir.join('reservoir_index.json').write(
+        '{{"sha256": "{}", "reservoirs": {{}}}}'.format(sysfile.sha256))
+    WaterWrapper.load_reservoir_index(index_file, sysfile, RESERVOIR_LEVELS.names)
+    assert len(count_builds) == 3
+
+    # an unreadable file
+    tmpdir.join('reservoir_index.json').write('{')
+    assert WaterWrapper.load_reservoir_index(
+        index_file, sysfile, RESERVOIR_LEVELS.names) == index
+    assert len(count_builds) == 4
+
+
+def test_inject_reservoir_levels_stale_index(count_builds):
+    """An index which does not match the sysfile is rebuilt rather than used
+    """
+    stale = {'sha256': 'stale', 'reservoirs': {
+        name: ['1', 0, 0, 0] for name in RESERVOIR_LEVELS.names}}
+
+    assert modify_sysfile(stale).lines == modify_sysfile().lines
+    assert len(count_builds) == 2
+
+
+SCRIPT = '''import sys
+
+import nodal_helper
+
+with open('nodal_output.txt', 'w') as fh:
+    fh.write('{} {}'.format(nodal_helper.VALUE, sys.argv[1:]))
+'''
+
+
+@pytest.mark.parametrize('in_process', [False, True])
+def test_call_script(tmpdir, in_process):
+    """Scripts import modules next to them and write relative to the working directory
+    """
+    script_dir = tmpdir.mkdir('nodal')
+    script_dir.join('prepare.py').write(SCRIPT)
+    script_dir.join('nodal_helper.py').write("VALUE = 'helper'\n")
+    cwd = os.getcwd()
+    path = list(sys.path)
+
+    WaterWrapper.call_script(
+        str(script_dir.join('prepare.py')), ['--flag', 'x'], str(script_dir), in_process)
+
+    assert script_dir.join('nodal_output.txt').read() == "helper ['--flag', 'x']"
+    assert os.getcwd() == cwd
+    assert sys.path == path
+    assert 'nodal_helper' not in sys.modules
+
+
+def test_run_script_exit_status(tmpdir):
+    script = tmpdir.join('fails.py')
+    script.write('import sys\nsys.exit(2)\n')
+
+    with pytest.raises(RuntimeError, match='status 2'):
+        WaterWrapper.run_script(str(script), [], str(tmpdir))
+
+
+@pytest.fixture
+def installed(tmpdir):
+    """An installed exe directory, with an input, a file which is not an input and a
+    file generated in a run
+    """
+    base_dir = tmpdir.mkdir('exe')
+    base_dir.join('National_Model.wat').write('sysfile')
+    base_dir.join('w5_console.log').write('log')
+    base_dir.join('modified_model.wat').write('generated')
+    base_dir.mkdir('lib').join('w5.dll').write('dll')
+    return str(base_dir)
+
+
+@pytest.mark.parametrize('mode', ['copy', 'hardlink', 'symlink'])
+def test_provision_dir(tmpdir, installed, mode):
+    model_dir = str(tmpdir.join('run', 'exe'))
+
+    WaterWrapper.provision_dir(installed, model_dir, mode)
+
+    for relpath in ['National_Model.wat', os.path.join('lib', 'w5.dll')]:
+        model_file = os.path.join(model_dir, relpath)
+        assert os.path.samefile(os.path.join(installed, relpath), model_file) == (mode != 'copy')
+        assert os.path.islink(model_file) == (mode == 'symlink')
+    assert not os.path.exists(os.path.join(model_dir, 'modified_model.wat'))
+
+    # files which are not inputs are copied, so writing to them leaves the installed file
+    with open(os.path.join(model_dir, 'w5_console.log'), 'a') as fh:
+        fh.write(' appended')
+    with open(os.path.join(installed, 'w5_console.log')) as fh:
+        assert fh.read() == 'log'
+
+
+def test_provision_dir_copies_linked_non_inputs(tmpdir, installed):
+    """Files which are not inputs, left as links by an earlier run, are replaced by copies
+    """
+    model_dir = tmpdir.mkdir('run')
+    model_dir.join('w5_console.log').mksymlinkto(os.path.join(installed, 'w5_console.log'))
+
+    WaterWrapper.provision_dir(installed, str(model_dir), 'symlink')
+
+    assert not model_dir.join('w5_console.log').islink()
+    assert model_dir.join('w5_console.log').read() == 'log'
+
+
+def test_provision_dir_removes_stale_files(tmpdir, installed):
+    model_dir = tmpdir.mkdir('run')
+    model_dir.join('old_input.csv').write('stale')
+    model_dir.mkdir('old').join('w5.dll').write('stale')
+    model_dir.join('modified_model_reservoirEndVolume.csv').write('output')
+
+    WaterWrapper.provision_dir(installed, str(model_dir), 'copy')
+
+    assert not model_dir.join('old_input.csv').exists()
+    assert not model_dir.join('old').exists()
+    assert model_dir.join('modified_model_reservoirEndVolume.csv').read() == 'output'
+
+
+def test_provision_dir_verifies_once(tmpdir, installed, monkeypatch):
+    """Files recorded as provisioned are not compared again unless they change on disk
+    """
+    model_dir = tmpdir.mkdir('run')
+    WaterWrapper.provision_dir(installed, str(model_dir), 'copy')
+
+    compared = []
+    files_match = run.files_match
+
+    def counted(installed_file, model_file):
+        compared.append(os.path.basename(model_file))
+        return files_match(installed_file, model_file)
+
+    monkeypatch.setattr(run, 'files_match', counted)
+    WaterWrapper.provision_dir(installed, str(model_dir), 'copy')
+    assert compared == []
+
+    sysfile = model_dir.join('National_Model.wat')
+    sysfile.write('changed sysfile')
+    WaterWrapper.provision_dir(installed, str(model_dir), 'copy')
+    assert compared == ['National_Model.wat']
+    assert sysfile.read() == 'sysfile'
+
+
+def test_provision_mode_from_environment(tmpdir, monkeypatch):
+    """An ensemble of model runs sets the provision mode in place of run_config.ini
+    """
+    config = tmpdir.join('run_config.ini')
+    config.write('[run]\nprovision_mode = copy\n')
+    wrapper = WaterWrapper.__new__(WaterWrapper)
+    wrapper._config_filename = str(config)
+
+    wrapper._set_options()
+    assert wrapper._provision_mode == 'copy'
+
+    monkeypatch.setenv('WATER_SUPPLY_PROVISION_MODE', 'hardlink')
+    wrapper._set_options()
+    assert wrapper._provision_mode == 'hardlink'
+
+    monkeypatch.setenv('WATER_SUPPLY_PROVISION_MODE', 'linked')
+    with pytest.raises(ValueError):
+        wrapper._set_options()
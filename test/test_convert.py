@@ -0,0 +1,54 @@
+"""Test the energy demand and supply adaptors
+"""
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('smif.convert')
+
+# Base directory
+NISMOD_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+spec = importlib.util.spec_from_file_location(
+    'nismod_convert', os.path.join(NISMOD_DIR, 'models', 'convert.py'))
+convert = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(convert)
+
+
+class DummyAdaptor(object):
+    """Converts with float64 coefficients, as smif adaptors do
+    """
+    def convert(self, data_array, coefficients):
+        return np.dot(getattr(data_array, 'data', data_array), coefficients)
+
+
+class DummyKeepFloat32(convert.KeepFloat32, DummyAdaptor):
+    pass
+
+
+class DummyDataArray(object):
+    def __init__(self, data):
+        self.data = data
+
+
+COEFFICIENTS = np.array([[0.5, 0.5, 0], [0, 0, 1]])
+
+
+def test_keep_float32():
+    data = np.array([[1, 2], [3, 4]], dtype=np.float32)
+
+    result = DummyKeepFloat32().convert(DummyDataArray(data), COEFFICIENTS)
+
+    assert result.dtype == np.float32
+    np.testing.assert_equal(result, [[0.5, 0.5, 2], [1.5, 1.5, 4]])
+
+
+def test_keep_float64():
+    data = np.array([[1, 2], [3, 4]], dtype=np.float64)
+
+    result = DummyKeepFloat32().convert(data, COEFFICIENTS)
+
+    assert result.dtype == np.float64
+    np.testing.assert_equal(result, [[0.5, 0.5, 2], [1.5, 1.5, 4]])
@@ -0,0 +1,102 @@
+"""Test the ensemble runner for the Arc water supply model runs
+"""
+import importlib.util
+import os
+
+import pytest
+
+# Base directory
+NISMOD_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+spec = importlib.util.spec_from_file_location(
+    'run_arc_ws_ensemble', os.path.join(NISMOD_DIR, 'utilities', 'run_arc_ws_ensemble.py'))
+ensemble = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ensemble)
+
+
+@pytest.fixture
+def smif_run(monkeypatch, tmpdir):
+    """Stands in for `smif run`, failing for model runs named in `failing`
+
+    Each call is recorded as (model run name, provision mode), and makes the water
+    supply model directory of the run.
+    """
+    monkeypatch.setattr(ensemble, 'WATER_SUPPLY_DIR', str(tmpdir.mkdir('water_supply')))
+    calls = []
+    failing = set()
+
+    def call(cmd, stdout, stderr, env):
+        name = cmd[2]
+        calls.append((name, env[ensemble.PROVISION_MODE_VARIABLE]))
+        os.makedirs(os.path.join(ensemble.WATER_SUPPLY_DIR, name, 'exe'), exist_ok=True)
+        stdout.write('running {}\n'.format(name))
+        return 1 if name in failing else 0
+
+    monkeypatch.setattr(ensemble.subprocess, 'call', call)
+    call.calls = calls
+    call.failing = failing
+    return call
+
+
+def write_batch(tmpdir, names):
+    batch_file = tmpdir.join('arc_ws__test.batch')
+    batch_file.write('\n'.join(names) + '\n')
+    return str(batch_file)
+
+
+def run_ensemble(tmpdir, batch_file, **kwargs):
+    return ensemble.main(
+        [batch_file], 2, str(tmpdir.join('results', 'ensemble.done')),
+        str(tmpdir.join('results', 'logs')), **kwargs)
+
+
+def test_read_batch_files(tmpdir):
+    batch_file = write_batch(tmpdir, ['a', '', '# a comment', 'b', 'a'])
+    other_file = write_batch(tmpdir.mkdir('other'), ['c', 'b'])
+
+    assert ensemble.read_batch_files([batch_file, other_file]) == ['a', 'b', 'c']
+
+
+def test_main_resumes(tmpdir, smif_run, capsys):
+    batch_file = write_batch(tmpdir, ['a', 'b', 'c'])
+    smif_run.failing.add('b')
+
+    assert run_ensemble(tmpdir, batch_file) == 1
+    assert sorted(smif_run.calls) == [('a', 'hardlink'), ('b', 'hardlink'), ('c', 'hardlink')]
+    assert ensemble.read_state(str(tmpdir.join('results', 'ensemble.done'))) == {'a', 'c'}
+    assert tmpdir.join('results', 'logs', 'b.log').read() == 'running b\n'
+    assert 'Failed model runs' in capsys.readouterr().out
+
+    # only the failed model run is run again
+    smif_run.failing.clear()
+    assert run_ensemble(tmpdir, batch_file) == 0
+    assert smif_run.calls[3:] == [('b', 'hardlink')]
+    assert ensemble.read_state(str(tmpdir.join('results', 'ensemble.done'))) == {'a', 'b', 'c'}
+
+    # nothing is left to run
+    assert run_ensemble(tmpdir, batch_file) == 0
+    assert len(smif_run.calls) == 4
+
+
+def test_main_clean(tmpdir, smif_run):
+    batch_file = write_batch(tmpdir, ['a', 'b'])
+    smif_run.failing.add('b')
+
+    run_ensemble(tmpdir, batch_file, clean=True)
+
+    # the directory of a failed model run is kept, to look into
+    assert not os.path.exists(os.path.join(ensemble.WATER_SUPPLY_DIR, 'a'))
+    assert os.path.isdir(os.path.join(ensemble.WATER_SUPPLY_DIR, 'b'))
+
+
+def test_main_provision_mode(tmpdir, smif_run, capsys):
+    batch_file = write_batch(tmpdir, ['a'])
+
+    run_ensemble(tmpdir, batch_file, provision_mode='symlink')
+    assert smif_run.calls == [('a', 'symlink')]
+    assert 'Warning' not in capsys.readouterr().out
+
+    tmpdir.join('results', 'ensemble.done').remove()
+    run_ensemble(tmpdir, batch_file, provision_mode='copy')
+    assert smif_run.calls[1:] == [('a', 'copy')]
+    assert 'Warning: provision mode copy' in capsys.readouterr().out
@@ -0,0 +1,145 @@
+"""Run an ensemble of model runs, such as the Arc water supply runs, in parallel
+
+Model runs are read from batch files (one model run name per line, as written for
+the runs from create_arc_ws_runs.py in batch/arc_ws__*.batch) and each is run with
+`smif run` in its own process, with at most --jobs running at once.
+
+Each water supply model run has its own models/water_supply/exe and
+models/water_supply/nodal directories. The runner sets the provision mode of the
+water supply wrapper (--provision-mode, hardlink by default) in place of
+`provision_mode` in models/water_supply/run_config.ini, so that the executable
+and static inputs link to the installed files, and are stored once however many
+runs there are. Other installed files are copied into each run.
+
+Completed model runs are recorded in a state file, so running the same command
+again after a failure or interruption only runs the model runs which did not
+complete. The output of each model run is written to its own log file.
+
+Usage:
+
+    python utilities/run_arc_ws_ensemble.py batch/arc_ws__baseline__BL.batch --jobs 8
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Base directory
+NISMOD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WATER_SUPPLY_DIR = os.path.join(NISMOD_DIR, 'models', 'water_supply')
+
+# Read by the water supply wrapper in place of provision_mode in its run_config.ini
+PROVISION_MODE_VARIABLE = 'WATER_SUPPLY_PROVISION_MODE'
+
+
+def read_batch_files(filenames):
+    """Read model run names from batch files, in order and without duplicates
+    """
+    modelruns = []
+    for filename in filenames:
+        with open(filename, 'r') as fh:
+            for line in fh:
+                name = line.strip()
+                if name and not name.startswith('#') and name not in modelruns:
+                    modelruns.append(name)
+    return modelruns
+
+
+def read_state(state_file):
+    try:
+        with open(state_file, 'r') as fh:
+            return set(line.strip() for line in fh if line.strip())
+    except FileNotFoundError:
+        return set()
+
+
+def run_model(modelrun_name, log_dir, interface=None, clean=False, provision_mode='hardlink'):
+    """Run a single model run, returning (model run name, return code, seconds)
+    """
+    start = time.time()
+
+    cmd = ['smif', 'run', modelrun_name, '-d', NISMOD_DIR]
+    if interface:
+        cmd += ['--interface', interface]
+    env = dict(os.environ)
+    env[PROVISION_MODE_VARIABLE] = provision_mode
+
+    log_file = os.path.join(log_dir, '{}.log'.format(os.path.basename(modelrun_name)))
+    with open(log_file, 'w') as fh:
+        returncode = subprocess.call(cmd, stdout=fh, stderr=subprocess.STDOUT, env=env)
+
+    # The water supply model directory, as named in `WaterWrapper._get_model_dir`
+    if clean and returncode == 0:
+        shutil.rmtree(
+            os.path.join(WATER_SUPPLY_DIR, os.path.basename(modelrun_name)), ignore_errors=True)
+
+    return modelrun_name, returncode, time.time() - start
+
+
+def main(batch_files, jobs, state_file, log_dir, interface=None, clean=False,
+         provision_mode='hardlink'):
+    modelruns = read_batch_files(batch_files)
+    completed = read_state(state_file)
+    pending = [name for name in modelruns if name not in completed]
+
+    print("Model runs {}, already complete {}, to run {} with {} jobs".format(
+        len(modelruns), len(modelruns) - len(pending), len(pending), jobs))
+    if provision_mode == 'copy':
+        print("Warning: provision mode copy gives each model run its own copy of the "
+              "water supply executable and inputs")
+
+    os.makedirs(log_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+
+    failed = []
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as executor, open(state_file, 'a') as state_fh:
+        futures = [
+            executor.submit(run_model, name, log_dir, interface, clean, provision_mode)
+            for name in pending
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            name, returncode, seconds = future.result()
+            if returncode == 0:
+                state_fh.write(name + '\n')
+                state_fh.flush()
+                status = 'ok'
+            else:
+                failed.append(name)
+                status = 'FAILED ({})'.format(returncode)
+
+            remaining = (time.time() - start) / done * (len(pending) - done)
+            print("[{}/{}] {} {} in {:.0f}s, {} failed, about {:.0f}s remaining".format(
+                done, len(pending), name, status, seconds, len(failed), remaining))
+
+    if failed:
+        print("Failed model runs, see logs in {}:".format(log_dir))
+        for name in failed:
+            print("  " + name)
+    return len(failed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('batch_files', nargs='+', help='batch files listing model runs')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of model runs at once (default: number of CPUs)')
+    parser.add_argument('--state', default=os.path.join(NISMOD_DIR, 'results', 'ensemble.done'),
+                        help='file recording completed model runs, to resume from')
+    parser.add_argument('--log-dir', default=os.path.join(NISMOD_DIR, 'results', 'ensemble_logs'),
+                        help='directory for the output of each model run')
+    parser.add_argument('-i', '--interface', help='smif data interface, e.g. local_binary')
+    parser.add_argument('--clean', action='store_true',
+                        help='remove the model directory of each run after it completes')
+    parser.add_argument('--provision-mode', choices=['hardlink', 'symlink', 'copy'],
+                        default='hardlink',
+                        help='how water supply model runs are given the installed files '
+                             '(default: hardlink)')
+    args = parser.parse_args()
+
+    sys.exit(1 if main(
+        args.batch_files, args.jobs, args.state, args.log_dir,
+        args.interface, args.clean, args.provision_mode) else 0)